@@ -1,4 +1,5 @@
 from flask import Flask, render_template, request, jsonify, send_file, Response, stream_template, send_from_directory
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
 import yt_dlp
 import os
 import threading
@@ -10,15 +11,519 @@ import requests
 import re
 import subprocess
 import shutil
+import queue
+import heapq
+import itertools
+import json
+import hashlib
+import functools
+import http.cookiejar
+import sqlite3
+import zipfile
+import bisect
+import contextlib
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlparse, quote
 
+# Optional: aiohttp powers the async streaming engine
+try:
+    import asyncio
+    import aiohttp
+    from aiohttp import web
+    AIOHTTP_AVAILABLE = True
+except ImportError:
+    AIOHTTP_AVAILABLE = False
+
 # Configure Flask to serve Vue.js build files
 app = Flask(__name__,
             static_folder='dist/assets',
             template_folder='dist')
 DOWNLOAD_DIR = "downloads"
-progress_data = {}
-video_info_data = {}
+
+class JobRecord:
+    """Progress of one download job, updated in place under its own lock.
+    A dict is only built when the record is read"""
+
+    __slots__ = ('lock', 'progress', 'progress_text', 'eta', 'speed', 'filename', 'status', 'download_ready',
+                 'error', 'format', 'quality', 'url', 'audio_url', 'quality_info', 'filesize', 'download_type',
+                 'video_id', 'bitrate', 'filepath', 'youtube_url', 'expires_at', 'timings', 'stream_timings')
+    FIELDS = __slots__[1:]
+
+    def __init__(self, **fields):
+        self.lock = threading.Lock()
+        for name in self.FIELDS:
+            setattr(self, name, None)
+        self.update(fields)
+
+    def update(self, fields):
+        with self.lock:
+            for name, value in fields.items():
+                setattr(self, name, value)
+
+    def snapshot(self):
+        """Consistent dict copy of the fields that are set"""
+        with self.lock:
+            return {name: getattr(self, name) for name in self.FIELDS if getattr(self, name) is not None}
+
+class RecordStore(dict):
+    """Dict of status records that wakes up subscribers whenever a record changes.
+    Records are plain dicts, or a record_type with update() and snapshot() such as JobRecord"""
+
+    def __init__(self, record_type=dict):
+        super().__init__()
+        self.record_type = record_type
+        self.lock = threading.Lock()
+        self.versions = {}
+        self.waiters = {}
+        self.waiting = {}
+
+    def _changed(self, key):
+        self.versions[key] = self.versions.get(key, 0) + 1
+        condition = self.waiters.get(key)
+        if condition is not None:
+            condition.notify_all()
+
+    def _removed(self, key):
+        # Wake any subscribers, then forget the record's bookkeeping
+        condition = self.waiters.pop(key, None)
+        if condition is not None:
+            condition.notify_all()
+        self.versions.pop(key, None)
+
+    def __setitem__(self, key, value):
+        if self.record_type is not dict and isinstance(value, dict):
+            value = self.record_type(**value)
+        with self.lock:
+            super().__setitem__(key, value)
+            self._changed(key)
+
+    def __delitem__(self, key):
+        with self.lock:
+            super().__delitem__(key)
+            self._removed(key)
+
+    def pop(self, key, *default):
+        with self.lock:
+            if key not in self:
+                return default[0] if default else super().pop(key)
+            value = super().pop(key)
+            self._removed(key)
+            return value
+
+    def merge(self, key, fields):
+        """Atomically update some fields of a record"""
+        with self.lock:
+            record = super().get(key)
+            if self.record_type is dict:
+                # Readers may be serializing the current dict - replace it instead of mutating it
+                record = dict(record or {})
+                super().__setitem__(key, record)
+            elif record is None:
+                record = self.record_type()
+                super().__setitem__(key, record)
+            record.update(fields)
+            self._changed(key)
+
+    def snapshot(self, key, default=None):
+        """A record as a plain dict, safe to serialize while it keeps changing"""
+        record = self.get(key)
+        if record is None:
+            return default
+        return record if self.record_type is dict else record.snapshot()
+
+    def expire(self, key, ttl):
+        """Records only live in this process, where the reaper already drops them on time"""
+
+    def wait_for_change(self, key, version, timeout):
+        """Block until the record's version moves past version (or timeout), returning the new version"""
+        with self.lock:
+            condition = self.waiters.get(key)
+            if condition is None:
+                condition = self.waiters[key] = threading.Condition(self.lock)
+            self.waiting[key] = self.waiting.get(key, 0) + 1
+            try:
+                condition.wait_for(lambda: self.versions.get(key, 0) != version, timeout)
+            finally:
+                # The last waiter drops the condition, so waits on unknown keys leave nothing behind
+                self.waiting[key] -= 1
+                if not self.waiting[key]:
+                    del self.waiting[key]
+                    if self.waiters.get(key) is condition:
+                        del self.waiters[key]
+            return self.versions.get(key, 0)
+
+# Where job records live - 'memory' keeps them in this process, 'sqlite' shares them between
+# worker processes (e.g. gunicorn -w 4) through a WAL-mode database file
+STATE_STORE = os.environ.get('STATE_STORE', 'memory')
+STATE_STORE_PATH = os.environ.get('STATE_STORE_PATH', 'state.db')
+STATE_POLL_INTERVAL = 0.25  # seconds between checks for writes from other processes
+
+class SQLiteRecordStore:
+    """Record store shared between processes through SQLite in WAL mode.
+
+    Records are stored as JSON with a version that every write bumps, so waiters in any process
+    see changes by polling it. Writes from this process also wake local waiters straight away.
+    Records past their TTL are invisible to reads even before a reaper deletes them."""
+
+    def __init__(self, name, path):
+        self.name = name
+        self.path = path
+        self.local = threading.local()
+        self.condition = threading.Condition()
+        db = self._db()
+        db.execute('''CREATE TABLE IF NOT EXISTS records (
+            store TEXT NOT NULL,
+            key TEXT NOT NULL,
+            value TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            expires_at REAL,
+            PRIMARY KEY (store, key))''')
+        db.execute('DELETE FROM records WHERE store = ? AND expires_at <= ?', (name, time.time()))
+
+    def _db(self):
+        # sqlite3 connections can't be shared between threads - keep one per thread
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self.local.db = db
+        return db
+
+    def _notify(self):
+        with self.condition:
+            self.condition.notify_all()
+
+    def _select(self, db, key):
+        return db.execute('SELECT value, version FROM records WHERE store = ? AND key = ? '
+                          'AND (expires_at IS NULL OR expires_at > ?)', (self.name, key, time.time())).fetchone()
+
+    def get(self, key, default=None):
+        row = self._select(self._db(), key)
+        return json.loads(row[0]) if row else default
+
+    def __getitem__(self, key):
+        row = self._select(self._db(), key)
+        if not row:
+            raise KeyError(key)
+        return json.loads(row[0])
+
+    def __contains__(self, key):
+        return self._select(self._db(), key) is not None
+
+    def __len__(self):
+        return self._db().execute('SELECT COUNT(*) FROM records WHERE store = ? '
+                                  'AND (expires_at IS NULL OR expires_at > ?)', (self.name, time.time())).fetchone()[0]
+
+    def __setitem__(self, key, value):
+        self._db().execute('INSERT INTO records (store, key, value, version) VALUES (?, ?, ?, 1) '
+                           'ON CONFLICT (store, key) DO UPDATE SET value = excluded.value, version = version + 1',
+                           (self.name, key, json.dumps(value)))
+        self._notify()
+
+    def __delitem__(self, key):
+        if self.pop(key, None) is None:
+            raise KeyError(key)
+
+    def pop(self, key, *default):
+        """Delete and return a record - expired ones too, since the reaper pops them once they expire"""
+        db = self._db()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            row = db.execute('SELECT value FROM records WHERE store = ? AND key = ?', (self.name, key)).fetchone()
+            db.execute('DELETE FROM records WHERE store = ? AND key = ?', (self.name, key))
+            db.execute('COMMIT')
+        except Exception:
+            db.execute('ROLLBACK')
+            raise
+        self._notify()
+        if row:
+            return json.loads(row[0])
+        if default:
+            return default[0]
+        raise KeyError(key)
+
+    def snapshot(self, key, default=None):
+        """A record as a plain dict - every read already decodes a fresh copy"""
+        return self.get(key, default)
+
+    def merge(self, key, fields):
+        """Atomically update some fields of a record"""
+        db = self._db()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            row = self._select(db, key)
+            record = json.loads(row[0]) if row else {}
+            record.update(fields)
+            db.execute('INSERT INTO records (store, key, value, version) VALUES (?, ?, ?, 1) '
+                       'ON CONFLICT (store, key) DO UPDATE SET value = excluded.value, version = version + 1',
+                       (self.name, key, json.dumps(record)))
+            db.execute('COMMIT')
+        except Exception:
+            db.execute('ROLLBACK')
+            raise
+        self._notify()
+
+    def expire(self, key, ttl):
+        """Hide the record after ttl seconds, even if the process that owns it has gone away"""
+        now = time.time()
+        db = self._db()
+        db.execute('UPDATE records SET expires_at = ? WHERE store = ? AND key = ?', (now + ttl, self.name, key))
+        db.execute('DELETE FROM records WHERE store = ? AND expires_at <= ?', (self.name, now))
+
+    def wait_for_change(self, key, version, timeout):
+        """Block until the record's version moves past version (or timeout), returning the new version"""
+        deadline = time.time() + timeout
+        while True:
+            row = self._select(self._db(), key)
+            current = row[1] if row else 0
+            remaining = deadline - time.time()
+            if current != version or remaining <= 0:
+                return current
+            with self.condition:
+                self.condition.wait(min(STATE_POLL_INTERVAL, remaining))
+
+def make_record_store(name, record_type=dict):
+    if STATE_STORE == 'sqlite':
+        # Shared records are JSON rows, so they are always plain dicts
+        return SQLiteRecordStore(name, STATE_STORE_PATH)
+    return RecordStore(record_type)
+
+progress_data = make_record_store('progress_data', JobRecord)
+video_info_data = make_record_store('video_info_data')
+batch_data = make_record_store('batch_data')
+
+# Metrics in the Prometheus text exposition format - hand-rolled so the app needs no extra
+# dependency. Updates take one uncontended lock, so they are cheap enough for streaming loops
+class MetricValue:
+    """One labelled counter or gauge value"""
+
+    __slots__ = ('lock', 'value')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        with self.lock:
+            self.value -= amount
+
+    def samples(self, name, labels):
+        return [(name, labels, self.value)]
+
+class HistogramValue:
+    """One labelled histogram - per-bucket counts, made cumulative when rendered"""
+
+    __slots__ = ('lock', 'buckets', 'counts', 'sum')
+
+    def __init__(self, buckets):
+        self.lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def samples(self, name, labels):
+        with self.lock:
+            counts = list(self.counts)
+            total = self.sum
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + [float('inf')], counts):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            samples.append((f"{name}_bucket", labels + (('le', le),), cumulative))
+        samples.append((f"{name}_sum", labels, round(total, 6)))
+        samples.append((f"{name}_count", labels, cumulative))
+        return samples
+
+class Metric:
+    """A named metric family. Values are looked up once per label set with labels(), so hot
+    paths can keep the returned value around"""
+
+    def __init__(self, name, help_text, metric_type, label_names=(), buckets=None):
+        self.name = name
+        self.help_text = help_text
+        self.metric_type = metric_type
+        self.label_names = label_names
+        self.buckets = buckets
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def labels(self, *label_values):
+        value = self.values.get(label_values)
+        if value is None:
+            with self.lock:
+                value = self.values.get(label_values)
+                if value is None:
+                    value = HistogramValue(self.buckets) if self.buckets else MetricValue()
+                    self.values[label_values] = value
+        return value
+
+    def samples(self):
+        samples = []
+        for label_values, value in list(self.values.items()):
+            samples += value.samples(self.name, tuple(zip(self.label_names, label_values)))
+        return samples
+
+class CallbackMetric:
+    """A metric family read from the rest of the app at scrape time.
+    fn returns a list of (label values, value)"""
+
+    def __init__(self, name, help_text, metric_type, label_names, fn):
+        self.name = name
+        self.help_text = help_text
+        self.metric_type = metric_type
+        self.label_names = label_names
+        self.fn = fn
+
+    def samples(self):
+        return [(self.name, tuple(zip(self.label_names, label_values)), value) for label_values, value in self.fn()]
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.metric_type}")
+            for name, labels, value in metric.samples():
+                if labels:
+                    label_text = ','.join(f'{key}="{escape_label(val)}"' for key, val in labels)
+                    lines.append(f"{name}{{{label_text}}} {value}")
+                else:
+                    lines.append(f"{name} {value}")
+        return '\n'.join(lines) + '\n'
+
+metrics = MetricsRegistry()
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0]
+DURATION_BUCKETS = [1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0, 3600.0]
+
+EXTRACTION_SECONDS = metrics.register(Metric(
+    'ytdl_extraction_seconds', 'yt-dlp metadata extraction latency', 'histogram', ('outcome',), LATENCY_BUCKETS))
+STREAM_TTFB_SECONDS = metrics.register(Metric(
+    'ytdl_stream_ttfb_seconds', 'Time from a stream request to its first byte', 'histogram', ('kind',), LATENCY_BUCKETS))
+STREAM_DURATION_SECONDS = metrics.register(Metric(
+    'ytdl_stream_duration_seconds', 'Total duration of streamed downloads', 'histogram', ('kind',), DURATION_BUCKETS))
+BYTES_PROXIED = metrics.register(Metric(
+    'ytdl_bytes_proxied_total', 'Bytes streamed to clients', 'counter', ('kind',)))
+ACTIVE_STREAMS = metrics.register(Metric(
+    'ytdl_active_streams', 'Streams currently being sent to clients', 'gauge', ('kind',)))
+
+def server_timing_header(timings):
+    """Server-Timing header value for a dict of durations in milliseconds"""
+    return ', '.join(f"{name};dur={duration}" for name, duration in timings.items())
+
+class StageTimer:
+    """Where one job or request spent its time - stage durations end up on the job record,
+    in a structured log line and in Server-Timing headers"""
+
+    def __init__(self, job, job_id, store=None, field='timings'):
+        self.job = job
+        self.job_id = job_id
+        self.store = store
+        self.field = field
+        self.started = time.perf_counter()
+        self.stages = {}
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def record(self, name, seconds):
+        # A stage that runs again (e.g. after a retry) adds up
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def timings(self):
+        """Stage durations in milliseconds, plus the total so far"""
+        timings = {name: round(seconds * 1000, 1) for name, seconds in self.stages.items()}
+        timings['total'] = round((time.perf_counter() - self.started) * 1000, 1)
+        return timings
+
+    def publish(self):
+        """Store the timings on the job record and log them"""
+        timings = self.timings()
+        if self.store is not None and self.job_id in self.store:
+            self.store.merge(self.job_id, {self.field: timings})
+        print(f"⏱️ Stage timing: {json.dumps({'job': self.job, 'id': self.job_id, 'stages': timings})}")
+        return timings
+
+class StreamMeter:
+    """Metrics for one stream - TTFB on the first chunk, bytes per chunk, duration once it ends.
+    The stream's StageTimer gets its ttfb and transfer stages and is published at the end"""
+
+    __slots__ = ('kind', 'timer', 'first_byte', 'bytes', 'finished')
+
+    def __init__(self, kind, timer):
+        self.kind = kind
+        self.timer = timer
+        self.first_byte = None
+        self.bytes = BYTES_PROXIED.labels(kind)
+        self.finished = False
+        ACTIVE_STREAMS.labels(kind).inc()
+
+    def chunk(self, size):
+        if self.first_byte is None:
+            self.first_byte = time.perf_counter()
+            ttfb = self.first_byte - self.timer.started
+            STREAM_TTFB_SECONDS.labels(self.kind).observe(ttfb)
+            self.timer.record('ttfb', ttfb)
+        self.bytes.inc(size)
+
+    def finish(self):
+        if self.finished:
+            return
+        self.finished = True
+        now = time.perf_counter()
+        ACTIVE_STREAMS.labels(self.kind).dec()
+        STREAM_DURATION_SECONDS.labels(self.kind).observe(now - self.timer.started)
+        if self.first_byte is not None:
+            self.timer.record('transfer', now - self.first_byte)
+        self.timer.publish()
+
+class MeteredStream:
+    """Wraps a response body so every chunk is counted. The WSGI server calls close() when the
+    response ends, which also closes the wrapped stream"""
+
+    def __init__(self, chunks, kind, timer):
+        self.chunks = chunks
+        self.meter = StreamMeter(kind, timer)
+
+    def __iter__(self):
+        try:
+            for chunk in self.chunks:
+                self.meter.chunk(len(chunk))
+                yield chunk
+        finally:
+            self.meter.finish()
+
+    def close(self):
+        if hasattr(self.chunks, 'close'):
+            self.chunks.close()
+        self.meter.finish()
 
 # Create download directory but clean it on startup
 os.makedirs(DOWNLOAD_DIR, exist_ok=True)
@@ -27,24 +532,69 @@ def check_ffmpeg():
     """Check if FFmpeg is available"""
     return shutil.which('ffmpeg') is not None
 
-def cleanup_download_directory():
-    """Clean up any existing files in download directory"""
+# Files a starting worker may remove when other workers share the directory - anything
+# younger could belong to a sibling's job or transcode that is still running
+STALE_FILE_AGE = int(os.environ.get('STALE_FILE_AGE', 3600))
+
+def cleanup_download_directory(max_age=0):
+    """Clean up existing files and job workspaces in download directory, or with max_age only
+    those untouched for that many seconds"""
     try:
         for filename in os.listdir(DOWNLOAD_DIR):
             file_path = os.path.join(DOWNLOAD_DIR, filename)
+            if max_age and time.time() - os.path.getmtime(file_path) < max_age:
+                continue
             if os.path.isfile(file_path):
                 os.unlink(file_path)
                 print(f"Cleaned up: {filename}")
+            elif os.path.isdir(file_path):
+                shutil.rmtree(file_path, ignore_errors=True)
+                print(f"Cleaned up: {filename}/")
     except Exception as e:
         print(f"Error cleaning download directory: {e}")
 
+# Per-job workspace limits for server-side audio downloads
+JOB_DISK_QUOTA = int(os.environ.get('JOB_DISK_QUOTA', 500 * 1024 ** 2))
+DOWNLOAD_DIR_HIGH_WATER = int(os.environ.get('DOWNLOAD_DIR_HIGH_WATER', 5 * 1024 ** 3))
+
+def job_workspace(download_id):
+    """Scratch directory owned by a single download job"""
+    return os.path.join(DOWNLOAD_DIR, download_id)
+
+def remove_job_workspace(download_id):
+    """Delete a job's scratch directory, leaving every other job's files alone"""
+    workspace = job_workspace(download_id)
+    if os.path.isdir(workspace):
+        shutil.rmtree(workspace, ignore_errors=True)
+        print(f"Cleaned up workspace: {download_id}")
+
+def download_dir_usage():
+    """Bytes currently used by all job workspaces"""
+    total = 0
+    for root, _, files in os.walk(DOWNLOAD_DIR):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass  # Removed while we were walking
+    return total
+
 # Check FFmpeg availability on startup
 FFMPEG_AVAILABLE = check_ffmpeg()
 if not FFMPEG_AVAILABLE:
     print("INFO: FFmpeg not found. Audio extraction disabled (direct streaming mode).")
 
-# Clean up any existing downloads on startup
-cleanup_download_directory()
+# Stream-transcode audio through ffmpeg instead of downloading it to the server first
+AUDIO_STREAMING = os.environ.get('AUDIO_STREAMING', '1') == '1'
+
+# Mux separate video and audio streams on the fly when the requested quality is only
+# offered as video-only (typically above 720p), instead of capping at the best progressive
+MUX_STREAMING = FFMPEG_AVAILABLE and os.environ.get('MUX_STREAMING', '1') == '1'
+MUX_STREAMS = int(os.environ.get('MUX_STREAMS', 16))
+
+# Clean up any existing downloads on startup. With a shared state store other worker
+# processes may be mid-job, so only stale leftovers go
+cleanup_download_directory(STALE_FILE_AGE if STATE_STORE == 'sqlite' else 0)
 print("🚀 Server running in direct streaming mode - no files stored on server!")
 
 def sanitize_filename(filename):
@@ -79,8 +629,413 @@ def clean_youtube_url(url):
         return f'https://www.youtube.com/watch?v={video_id}'
     return url
 
-def get_video_info(url, info_id):
+def get_video_id(url):
+    """Get the canonical video ID used to key caches (falls back to the cleaned URL)"""
+    url = clean_youtube_url(url)
+    if url.startswith('https://www.youtube.com/watch?v='):
+        return url.split('v=')[1]
+    return url
+
+def url_expiry(url):
+    """Expiry time (epoch seconds) signed into a googlevideo URL, or None"""
+    match = re.search(r'[?&/]expire[=/](\d+)', url or '')
+    return int(match.group(1)) if match else None
+
+# Signed stream URLs are re-resolved when they have less than this many seconds left
+STREAM_URL_MIN_LIFETIME = int(os.environ.get('STREAM_URL_MIN_LIFETIME', 300))
+
+# Extraction cache settings - signed googlevideo URLs stay valid for about 6 hours, so
+# cached extractions are dropped before the stream URLs inside them go stale. Within
+# INFO_CACHE_REFRESH_AHEAD of that point an entry is still served, but refreshed in the background
+INFO_CACHE_MAX_ENTRIES = int(os.environ.get('INFO_CACHE_MAX_ENTRIES', 256))
+INFO_CACHE_TTL = int(os.environ.get('INFO_CACHE_TTL', 5 * 3600))
+INFO_CACHE_REFRESH_AHEAD = int(os.environ.get('INFO_CACHE_REFRESH_AHEAD', 1800))
+
+class InfoCache:
+    """Thread-safe LRU cache of yt-dlp extraction results with a TTL, capped by the expiry
+    of the signed URLs inside each result"""
+
+    def __init__(self, max_entries, ttl, refresh_ahead):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.refresh_ahead = refresh_ahead
+        self.entries = OrderedDict()
+        self.refreshing = set()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.refreshes = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, info = entry
+            if expires_at <= time.time():
+                del self.entries[key]
+                self.evictions += 1
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return info
+
+    def put(self, key, info):
+        expires_at = time.time() + self.ttl
+        expiries = [url_expiry(f.get('url')) for f in info.get('formats') or [] if f]
+        expiries = [expiry for expiry in expiries if expiry]
+        if expiries:
+            expires_at = min(expires_at, min(expiries) - STREAM_URL_MIN_LIFETIME)
+        with self.lock:
+            self.entries[key] = (expires_at, info)
+            self.entries.move_to_end(key)
+            self.refreshing.discard(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def claim_refresh(self, key):
+        """True if the entry is close to expiry and nobody is refreshing it yet - the caller must
+        then refresh it with put(), or give the claim back with release_refresh()"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or key in self.refreshing or entry[0] - self.refresh_ahead > time.time():
+                return False
+            self.refreshing.add(key)
+            self.refreshes += 1
+            return True
+
+    def release_refresh(self, key):
+        with self.lock:
+            self.refreshing.discard(key)
+
+    def invalidate(self, key, failed_url=None):
+        """Drop an entry - with failed_url, only if the entry is where that URL came from, so a
+        fresh extraction stored by a parallel refresh survives another stream's 403"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and (not failed_url or self._holds(entry[1], failed_url)):
+                del self.entries[key]
+
+    @staticmethod
+    def _holds(info, url):
+        urls = [f.get('url') for f in info.get('formats') or [] if f]
+        if url in urls:
+            return True
+        # Redirected URLs aren't in the formats - compare the signed expiry instead, and treat
+        # the entry as stale when neither side has one
+        expiry = url_expiry(url)
+        expiries = [expiry for expiry in map(url_expiry, urls) if expiry]
+        return not expiry or not expiries or min(expiries) <= expiry
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'refreshes': self.refreshes,
+                'hit_ratio': round(self.hits / lookups, 3) if lookups else 0.0
+            }
+
+info_cache = InfoCache(INFO_CACHE_MAX_ENTRIES, INFO_CACHE_TTL, INFO_CACHE_REFRESH_AHEAD)
+
+class SingleFlight:
+    """Collapses concurrent calls with the same key into one in-flight call"""
+
+    def __init__(self):
+        self.calls = {}
+        self.lock = threading.Lock()
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key, fn, *args):
+        """Run fn(*args), or wait for and share the result of the call already running for key"""
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = {'done': threading.Event(), 'result': None, 'error': None}
+                self.calls[key] = call
+                self.executed += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call['done'].wait()
+            if call['error'] is not None:
+                raise call['error']
+            return call['result']
+
+        try:
+            call['result'] = fn(*args)
+            return call['result']
+        except Exception as e:
+            call['error'] = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call['done'].set()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'in_flight': len(self.calls),
+                'executed': self.executed,
+                'coalesced': self.coalesced
+            }
+
+extraction_flights = SingleFlight()
+
+def extract_video_info(url, ydl_opts):
+    """Extract video info through the cache, only calling yt-dlp on a miss.
+    Concurrent misses for the same video share a single extraction."""
+    video_id = get_video_id(url)
+
+    def extract():
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                info = ydl.extract_info(url, download=False)
+            outcome = 'ok' if info else 'empty'
+        finally:
+            # Failed extractions are often the slowest, so they are observed too
+            EXTRACTION_SECONDS.labels(outcome).observe(time.perf_counter() - started)
+        if info:
+            info_cache.put(video_id, info)
+        return info
+
+    def refresh():
+        try:
+            extraction_flights.do(video_id, extract)
+        except Exception as e:
+            print(f"Background refresh failed for {video_id}: {e}")
+        finally:
+            info_cache.release_refresh(video_id)
+
+    info = info_cache.get(video_id)
+    if info is not None:
+        # Stale-while-revalidate - serve the cached extraction, fetch fresh URLs in the background
+        if info_cache.claim_refresh(video_id) and not scheduler.submit('info', refresh):
+            info_cache.release_refresh(video_id)
+        return info
+
+    return extraction_flights.do(video_id, extract)
+
+# How long finished records are kept around for polling
+VIDEO_INFO_TTL = 1800  # 30 minutes
+PROGRESS_TTL = 600  # 10 minutes
+
+class ExpiryReaper:
+    """Expires record-store entries from a single thread using a min-heap of deadlines"""
+
+    def __init__(self):
+        self.stores = {}
+        self.evicted = {}
+        self.heap = []
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+        threading.Thread(target=self._run, name="expiry-reaper", daemon=True).start()
+
+    def register(self, name, store):
+        self.stores[name] = store
+        self.evicted[name] = 0
+
+    def schedule(self, name, key, ttl, callback=None):
+        """Drop store[key] after ttl seconds, then run the optional callback"""
+        self.stores[name].expire(key, ttl)
+        with self.condition:
+            heapq.heappush(self.heap, (time.time() + ttl, next(self.counter), name, key, callback))
+            self.condition.notify()
+
+    def call_later(self, delay, callback):
+        """Run callback after delay seconds without dropping anything - it runs on the reaper
+        thread, so anything slow should be handed to the scheduler"""
+        with self.condition:
+            heapq.heappush(self.heap, (time.time() + delay, next(self.counter), None, None, callback))
+            self.condition.notify()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.heap:
+                    self.condition.wait()
+                delay = self.heap[0][0] - time.time()
+                if delay > 0:
+                    self.condition.wait(delay)
+                    continue
+                _, _, name, key, callback = heapq.heappop(self.heap)
+                if name and self.stores[name].pop(key, None) is not None:
+                    self.evicted[name] += 1
+            if callback:
+                try:
+                    callback()
+                except Exception as e:
+                    print(f"Expiry callback error for {name}/{key}: {e}")
+
+    def stats(self):
+        with self.condition:
+            stats = {
+                name: {'live': len(store), 'evicted': self.evicted[name]}
+                for name, store in self.stores.items()
+            }
+            stats['scheduled'] = len(self.heap)
+            return stats
+
+reaper = ExpiryReaper()
+reaper.register('video_info_data', video_info_data)
+reaper.register('progress_data', progress_data)
+reaper.register('batch_data', batch_data)
+
+def compact_formats(formats):
+    """Keep only the format fields needed to pick a stream later"""
+    compact = []
+    for f in formats:
+        if not f or not f.get('url'):
+            continue
+        compact.append({
+            'format_id': f.get('format_id', ''),
+            'ext': f.get('ext', ''),
+            'url': f['url'],
+            'height': f.get('height') or 0,
+            'vcodec': f.get('vcodec', 'none'),
+            'acodec': f.get('acodec', 'none'),
+            'tbr': f.get('tbr') or 0,
+            'filesize': f.get('filesize') or f.get('filesize_approx') or 0,
+            'protocol': f.get('protocol') or 'https',
+            'format_note': f.get('format_note', ''),
+            'expires_at': url_expiry(f['url'])
+        })
+    return compact
+
+def select_video_format(formats, quality):
+    """Pick the stream for a video quality - the 'best[height<=N]' branch of yt-dlp's selector,
+    since only a single URL can be streamed without merging"""
+    max_height = int(quality) if quality.isdigit() else 1080
+
+    def sort_key(f):
+        return (f['height'], f['tbr'])
+
+    # Prefer formats with both video and audio within the height limit
+    candidates = [f for f in formats
+                  if f['vcodec'] != 'none' and f['acodec'] != 'none' and 0 < f['height'] <= max_height]
+    if not candidates:
+        # Fall back to any video within the limit, then to the lowest video available
+        candidates = [f for f in formats if f['vcodec'] != 'none' and 0 < f['height'] <= max_height]
+    if candidates:
+        return max(candidates, key=sort_key)
+
+    videos = [f for f in formats if f['vcodec'] != 'none' and f['height'] > 0]
+    if videos:
+        return min(videos, key=sort_key)
+
+    # Last resort - the last format with a URL, as yt-dlp orders formats worst to best
+    return formats[-1] if formats else None
+
+def select_audio_format(formats):
+    """Pick the highest bitrate audio-only stream, falling back to the smallest muxed one"""
+    audio = [f for f in formats if f['vcodec'] == 'none' and f['acodec'] != 'none']
+    if audio:
+        return max(audio, key=lambda f: f['tbr'])
+
+    muxed = [f for f in formats if f['acodec'] != 'none']
+    if muxed:
+        return min(muxed, key=lambda f: (f['height'], f['tbr']))
+    return None
+
+def select_mux_formats(formats, quality):
+    """Pick a video-only and an audio-only stream to mux when they beat the best progressive
+    format for this quality, or return None to stream a single format"""
+    max_height = int(quality) if quality.isdigit() else 1080
+
+    progressive = [f['height'] for f in formats
+                   if f['vcodec'] != 'none' and f['acodec'] != 'none' and 0 < f['height'] <= max_height]
+    # Only plain HTTP(S) streams can be fed through a pipe - manifests need ffmpeg to fetch them
+    formats = [f for f in formats if f.get('protocol', 'https') in ('http', 'https')]
+    video_only = [f for f in formats
+                  if f['vcodec'] != 'none' and f['acodec'] == 'none' and 0 < f['height'] <= max_height]
+    if not video_only:
+        return None
+
+    # Prefer H.264 in MP4 at the same height - it plays everywhere without re-encoding
+    video = max(video_only, key=lambda f: (f['height'], f['ext'] == 'mp4', (f['vcodec'] or '').startswith('avc1'), f['tbr']))
+    if video['height'] <= max(progressive, default=0):
+        return None
+
+    audio_only = [f for f in formats if f['vcodec'] == 'none' and f['acodec'] != 'none']
+    if not audio_only:
+        return None
+    # AAC goes into MP4 as-is; Opus works too, so only fall back to it when there is no AAC
+    audio = max(audio_only, key=lambda f: ((f['acodec'] or '').startswith('mp4a'), f['tbr']))
+    return video, audio
+
+# Qualities offered by the UI - the info phase resolves each of them once
+VIDEO_QUALITIES = ['best', '1080', '720', '480', '360', '240']
+AUDIO_QUALITIES = {'high': '320', 'medium': '192', 'low': '128'}
+
+def quality_entry(video, audio=None):
+    """Quality index entry for a single stream, or for a video and audio stream to mux"""
+    entry = {
+        'format_id': video['format_id'],
+        'url': video['url'],
+        'ext': video['ext'],
+        'height': video['height'],
+        'vcodec': video['vcodec'],
+        'acodec': video['acodec'],
+        'filesize': video['filesize'],
+        'format_note': video['format_note'],
+        'expires_at': video['expires_at']
+    }
+    if audio:
+        entry.update({
+            'format_id': f"{video['format_id']}+{audio['format_id']}",
+            'audio_url': audio['url'],
+            'expires_at': min(filter(None, (video['expires_at'], audio['expires_at'])), default=None),
+            'ext': 'mp4',
+            'acodec': audio['acodec'],
+            'filesize': video['filesize'] + audio['filesize'] if video['filesize'] and audio['filesize'] else 0
+        })
+    return entry
+
+def build_quality_index(formats, duration=0):
+    """Resolve every supported quality to its stream(s) up front, so starting a download is a lookup"""
+    index = {'video': {}, 'audio': {}}
+    for quality in VIDEO_QUALITIES:
+        mux_formats = select_mux_formats(formats, quality) if MUX_STREAMING else None
+        if mux_formats:
+            index['video'][quality] = quality_entry(*mux_formats)
+            continue
+        video_format = select_video_format(formats, quality)
+        if video_format:
+            index['video'][quality] = quality_entry(video_format)
+
+    audio_format = select_audio_format(formats)
+    if audio_format:
+        for tier, bitrate in AUDIO_QUALITIES.items():
+            index['audio'][tier] = {
+                'format_id': audio_format['format_id'],
+                'url': audio_format['url'],
+                'acodec': audio_format['acodec'],
+                'bitrate': bitrate,
+                'expires_at': audio_format['expires_at'],
+                # The MP3 is constant bitrate, so its size follows from the duration
+                'filesize': int(duration * int(bitrate) * 1000 / 8) if duration else 0
+            }
+    return index
+
+def get_video_info(url, info_id, speculate=True):
     """Get video information without downloading - Optimized for speed"""
+    video_info_data[info_id] = {'status': 'starting'}
+    timer = StageTimer('info', info_id, video_info_data)
     # Clean the URL first
     url = clean_youtube_url(url)
     try:
@@ -99,109 +1054,198 @@ def get_video_info(url, info_id):
             'playlist_items': '1'
         }
         
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            # Extract video info with minimal processing
-            info = ydl.extract_info(url, download=False)
-            if not info:
-                video_info_data[info_id] = {'error': 'Failed to extract video info', 'status': 'error'}
-                return
-                
-            # Extract only essential info for speed
-            title = info.get('title', 'Unknown Title')
-            duration = info.get('duration', 0)
-            uploader = info.get('uploader', 'Unknown')
-            view_count = info.get('view_count', 0)
-            thumbnail = info.get('thumbnail', '')
-            description = info.get('description', '')[:200] + '...' if info.get('description', '') else 'No description available'
-            ext = info.get('ext', 'mp4')
-            
-            # Fast duration formatting
-            if duration:
-                minutes = duration // 60
-                seconds = duration % 60
-                duration_str = f"{minutes}:{seconds:02d}"
-            else:
-                duration_str = "Unknown"
-            
-            # Fast view count formatting
-            if view_count:
-                if view_count >= 1000000:
-                    view_str = f"{view_count//1000000}M views"
-                elif view_count >= 1000:
-                    view_str = f"{view_count//1000}K views"
-                else:
-                    view_str = f"{view_count} views"
+        # Extract video info with minimal processing (served from cache when possible)
+        with timer.stage('extract'):
+            info = extract_video_info(url, ydl_opts)
+        if not info:
+            video_info_data[info_id] = {'error': 'Failed to extract video info', 'status': 'error'}
+            return
+
+        # Extract only essential info for speed
+        title = info.get('title', 'Unknown Title')
+        duration = info.get('duration', 0)
+        uploader = info.get('uploader', 'Unknown')
+        view_count = info.get('view_count', 0)
+        thumbnail = info.get('thumbnail', '')
+        description = info.get('description', '')[:200] + '...' if info.get('description', '') else 'No description available'
+        ext = info.get('ext', 'mp4')
+        
+        # Fast duration formatting
+        if duration:
+            minutes = duration // 60
+            seconds = duration % 60
+            duration_str = f"{minutes}:{seconds:02d}"
+        else:
+            duration_str = "Unknown"
+        
+        # Fast view count formatting
+        if view_count:
+            if view_count >= 1000000:
+                view_str = f"{view_count//1000000}M views"
+            elif view_count >= 1000:
+                view_str = f"{view_count//1000}K views"
             else:
-                view_str = "Unknown views"
-            
-            # Fast filename sanitization
-            original_filename = f"{title}.{ext}"
-            safe_filename = sanitize_filename(original_filename)
-            
-            # Optimized format selection - get first good format quickly
-            formats = info.get('formats', [])
-            best_video_format = None
-            
-            # Quick format selection - prioritize mp4 with both video and audio
-            for f in formats:
-                if (f and f.get('vcodec') != 'none' and
-                    f.get('acodec') != 'none' and
-                    f.get('ext') == 'mp4' and
-                    f.get('height', 0) > 0):
-                    best_video_format = f
-                    break
-            
-            # Fallback to any format with video
-            if not best_video_format:
-                for f in formats:
-                    if f and f.get('vcodec') != 'none' and f.get('height', 0) > 0:
-                        best_video_format = f
-                        break
-            
-            # Last resort - any format
-            if not best_video_format and formats:
-                best_video_format = formats[0]  # Take first instead of last
+                view_str = f"{view_count} views"
+        else:
+            view_str = "Unknown views"
+        
+        # Fast filename sanitization
+        original_filename = f"{title}.{ext}"
+        safe_filename = sanitize_filename(original_filename)
+        
+        # Resolve every quality once - downloads then look their streams up in this index
+        with timer.stage('select'):
+            quality_index = build_quality_index(compact_formats(info.get('formats', [])), duration)
+        best_video_format = quality_index['video'].get('best')
+
+        if best_video_format:
+            direct_url = best_video_format['url']
+            format_info = best_video_format['format_note']
+            height = best_video_format['height']
             
-            if best_video_format:
-                direct_url = best_video_format.get('url', '')
-                format_info = best_video_format.get('format_note', '')
-                height = best_video_format.get('height', 0)
-                
-                # Store video info immediately
-                video_info_data[info_id] = {
-                    'title': title,
-                    'duration': duration_str,
-                    'uploader': uploader,
-                    'view_count': view_str,
-                    'thumbnail': thumbnail,
-                    'description': description,
-                    'filename': safe_filename,
-                    'original_filename': original_filename,
-                    'url': direct_url,
-                    'original_youtube_url': url,
-                    'status': 'ready',
-                    'ext': ext,
-                    'format_info': format_info,
-                    'height': height
-                }
-            else:
-                video_info_data[info_id] = {'error': 'No suitable video format found', 'status': 'error'}
+            # Store video info immediately
+            video_info_data[info_id] = {
+                'title': title,
+                'duration': duration_str,
+                'uploader': uploader,
+                'view_count': view_str,
+                'thumbnail': thumbnail,
+                'description': description,
+                'filename': safe_filename,
+                'original_filename': original_filename,
+                'url': direct_url,
+                'expires_at': best_video_format['expires_at'],
+                'original_youtube_url': url,
+                'status': 'ready',
+                'ext': ext,
+                'format_info': format_info,
+                'height': height,
+                'quality_index': quality_index
+            }
+
+            # Warm up the streams the user is most likely to pick next - dropped when the budget is used up
+            if speculate:
+                scheduler.submit('speculative', speculative_resolver.run, info_id)
+        else:
+            video_info_data[info_id] = {'error': 'No suitable video format found', 'status': 'error'}
                 
     except Exception as e:
         video_info_data[info_id] = {'error': str(e), 'status': 'error'}
-    
-    # Clean up video info data after 30 minutes
-    def cleanup_video_info():
-        time.sleep(1800)  # 30 minutes
-        if info_id in video_info_data:
-            del video_info_data[info_id]
-    
-    threading.Thread(target=cleanup_video_info, daemon=True).start()
+    finally:
+        timer.publish()
+        # Clean up video info data after 30 minutes
+        reaper.schedule('video_info_data', info_id, VIDEO_INFO_TTL)
+
+def resolve_quality_index(youtube_url, quality_index):
+    """Return the info-phase quality index, falling back to the (cached) extraction"""
+    if not quality_index:
+        # Info record predates the quality index
+        ydl_opts = {
+            'format': 'best',
+            'quiet': True,
+            'no_warnings': True,
+            'noplaylist': True,
+            'extract_flat': False,
+            'max_downloads': 1,
+            'playlist_items': '1',
+            'format_sort': ['res', 'fps', 'codec', 'ext']
+        }
+        info = extract_video_info(youtube_url, ydl_opts) or {}
+        quality_index = build_quality_index(compact_formats(info.get('formats', [])), info.get('duration') or 0)
+
+    if not quality_index['video'] and not quality_index['audio']:
+        raise Exception("No formats available for this video")
+    return quality_index
+
+# yt-dlp calls progress hooks for every block it writes - far more often than anyone polls
+PROGRESS_UPDATE_INTERVAL = float(os.environ.get('PROGRESS_UPDATE_INTERVAL', 0.5))
+
+def format_bytes(size):
+    """Human-readable size in binary units, e.g. 1.5MiB"""
+    if size < 1024:
+        return f"{int(size)}B"
+    for unit in ('KiB', 'MiB', 'GiB'):
+        size /= 1024
+        if size < 1024 or unit == 'GiB':
+            return f"{size:.1f}{unit}"
 
-def download_video(download_id, youtube_url, filename, original_filename, format_type, quality):
+def format_eta(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes:02d}:{seconds:02d}"
+
+class ProgressReporter:
+    """yt-dlp progress hook that reads the numeric fields and publishes at most one update per
+    interval, and only when the visible progress has changed. With a quota, the download is
+    aborted as soon as it writes more than that many bytes"""
+
+    def __init__(self, download_id, filename, interval=PROGRESS_UPDATE_INTERVAL, quota=None):
+        self.download_id = download_id
+        self.filename = filename
+        self.interval = interval
+        self.quota = quota
+        self.next_update = 0.0
+        self.last_step = None
+        self.callbacks = 0
+        self.published = 0
+
+    def __call__(self, d):
+        self.callbacks += 1
+        if d['status'] == 'downloading':
+            downloaded = d.get('downloaded_bytes') or 0
+            # yt-dlp's max_filesize only applies when the upstream reports a size
+            if self.quota and downloaded > self.quota:
+                raise Exception("Audio file exceeds the per-job disk quota")
+
+            now = time.monotonic()
+            if now < self.next_update:
+                return
+
+            total = d.get('total_bytes') or d.get('total_bytes_estimate') or 0
+            if total:
+                percent = round(min(downloaded * 100 / total, 100), 1)
+                step = percent
+                progress_text = f"{percent}%"
+            else:
+                # Unknown size - count whole MiB instead
+                percent = 0.0
+                step = downloaded >> 20
+                progress_text = format_bytes(downloaded)
+            if step == self.last_step:
+                return
+            self.last_step = step
+            self.next_update = now + self.interval
+
+            speed = d.get('speed')
+            eta = d.get('eta')
+            self.publish({
+                'progress': f"{percent}%",
+                'progress_text': progress_text,
+                'eta': format_eta(eta) if eta is not None else '...',
+                'speed': f"{format_bytes(speed)}/s" if speed else '...',
+                'filename': os.path.basename(d.get('filename') or self.filename),
+                'status': 'downloading'
+            })
+        elif d['status'] == 'finished':
+            # The MP3 only exists once FFmpegExtractAudio has run
+            self.publish({
+                'progress': '100%',
+                'progress_text': 'Converting to MP3...',
+                'eta': '...',
+                'speed': '...',
+                'filename': self.filename,
+                'status': 'processing'
+            })
+
+    def publish(self, fields):
+        self.published += 1
+        progress_data.merge(self.download_id, fields)
+
+def download_video(download_id, youtube_url, filename, original_filename, format_type, quality, quality_index=None):
     """Get direct download URL for streaming to browser without server storage"""
     # Clean the URL first to remove playlist parameters
     youtube_url = clean_youtube_url(youtube_url)
+    timer = StageTimer('download', download_id, progress_data)
     try:
         # Initialize progress
         progress_data[download_id] = {
@@ -228,137 +1272,129 @@ def download_video(download_id, youtube_url, filename, original_filename, format
                 }
                 return
 
-            # Audio download with progress tracking
-            def progress_hook(d):
-                if d['status'] == 'downloading':
-                    percent_str = d.get('_percent_str', '0.0%')
-                    try:
-                        percent_num = float(percent_str.replace('%', '').strip()) if percent_str else 0
-                        progress_data[download_id] = {
-                            'progress': f"{percent_num}%",
-                            'progress_text': percent_str,
-                            'eta': d.get('_eta_str', '...'),
-                            'speed': d.get('_speed_str', '...'),
-                            'filename': os.path.basename(d.get('filename', filename)),
-                            'status': 'downloading'
-                        }
-                    except:
-                        pass
-                elif d['status'] == 'finished':
-                    final_filename = d.get('filename', filename)
+            # Update filename for audio
+            base_name = os.path.splitext(filename)[0]
+            filename = f"{base_name}.mp3"
+            bitrate = AUDIO_QUALITIES.get(quality, '192')
+            cache_key = (get_video_id(youtube_url), 'mp3', bitrate)
+
+            if not AUDIO_STREAMING:
+                # A cached transcode skips both the yt-dlp download and the ffmpeg work
+                with timer.stage('cache'):
+                    cached_file = audio_cache.get(cache_key)
+                if cached_file:
+                    cached_file.close()
                     progress_data[download_id] = {
                         'progress': '100%',
                         'progress_text': '100%',
                         'eta': 'Done',
                         'speed': 'Done',
-                        'filename': os.path.basename(final_filename),
+                        'filename': filename,
                         'download_ready': True,
                         'status': 'finished',
-                        'filepath': final_filename,
-                        'download_type': 'audio'
+                        'video_id': cache_key[0],
+                        'bitrate': bitrate,
+                        # Lets the stream transcode again if the entry is evicted before the click
+                        'youtube_url': youtube_url,
+                        'quality': quality,
+                        'download_type': 'audio-cached'
                     }
+                    return
 
-            # Audio download options
-            audio_quality_map = {
-                'high': '320',
-                'medium': '192',
-                'low': '128'
-            }
+            if AUDIO_STREAMING:
+                # Audio: transcode on the fly while streaming - nothing is downloaded up front
+                with timer.stage('resolve'):
+                    audio_index = resolve_quality_index(youtube_url, quality_index)['audio']
+                with timer.stage('select'):
+                    audio_format = audio_index.get(quality, {})
+                    if not audio_format:
+                        raise Exception("No playable format found")
+                    # The transcode sets its own size, so only a pre-resolved URL is taken over
+                    resolved_url = speculative_resolver.take(audio_format).get('url', audio_format['url'])
+
+                progress_data[download_id] = {
+                    'progress': '100%',
+                    'progress_text': 'Ready for download',
+                    'eta': 'Ready',
+                    'speed': 'Ready',
+                    'filename': filename,
+                    'download_ready': True,
+                    'status': 'finished',
+                    'url': resolved_url,
+                    'expires_at': audio_format['expires_at'],
+                    'youtube_url': youtube_url,
+                    'quality': quality,
+                    'video_id': cache_key[0],
+                    'bitrate': bitrate,
+                    'download_type': 'audio-stream'
+                }
+                return
+
+            # Audio download with progress tracking
+            progress_hook = ProgressReporter(download_id, filename, quota=JOB_DISK_QUOTA)
 
             ydl_opts = {
                 'format': 'bestaudio[ext=m4a]/bestaudio[ext=webm]/bestaudio/best',
                 'postprocessors': [{
                     'key': 'FFmpegExtractAudio',
                     'preferredcodec': 'mp3',
-                    'preferredquality': audio_quality_map.get(quality, '192'),
+                    'preferredquality': bitrate,
                 }],
-                'outtmpl': os.path.join(DOWNLOAD_DIR, '%(title)s.%(ext)s'),
+                'outtmpl': os.path.join(job_workspace(download_id), '%(title)s.%(ext)s'),
+                'max_filesize': JOB_DISK_QUOTA,
                 'progress_hooks': [progress_hook],
                 'quiet': False,
                 'no_warnings': False
             }
 
-            # Update filename for audio
-            base_name = os.path.splitext(filename)[0]
-            filename = f"{base_name}.mp3"
-
             # Download audio file to server
             print(f"Starting audio download with quality: {quality}")
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                ydl.download([youtube_url])
-            return
+            with timer.stage('download'), yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                info = ydl.extract_info(youtube_url, download=True)
+            # yt-dlp skips files over max_filesize instead of failing, leaving a filepath that was never written
+            final_filename = info['requested_downloads'][0].get('filepath') if info and info.get('requested_downloads') else None
+            if not final_filename or not os.path.isfile(final_filename):
+                raise Exception("Audio file exceeds the per-job disk quota")
 
-        else:
-            # Video download options with flexible format selection
-            if quality == 'best':
-                format_selector = 'bestvideo[height<=?1080]+bestaudio/best'
-            elif quality == '1080':
-                format_selector = 'bestvideo[height<=1080]+bestaudio/best[height<=1080]'
-            elif quality == '720':
-                format_selector = 'bestvideo[height<=720]+bestaudio/best[height<=720]'
-            elif quality == '480':
-                format_selector = 'bestvideo[height<=480]+bestaudio/best[height<=480]'
-            elif quality == '360':
-                format_selector = 'bestvideo[height<=360]+bestaudio/best[height<=360]'
-            elif quality == '240':
-                format_selector = 'bestvideo[height<=240]+bestaudio/best[height<=240]'
-            else:
-                format_selector = 'bestvideo+bestaudio/best'
+            # Keep a copy in the audio cache - the served file is deleted after download
+            with timer.stage('cache'):
+                audio_cache.store(cache_key, final_filename)
 
-            ydl_opts = {
-                'format': format_selector,
-                'quiet': True,
-                'no_warnings': True,
-                'noplaylist': True,
-                'extract_flat': False,
-                'max_downloads': 1,
-                'playlist_items': '1',
-                'skip_download': False,
-                'format_sort': ['res', 'fps', 'codec', 'ext'],
-                'merge_output_format': None  # Let yt-dlp choose the best format
+            progress_data[download_id] = {
+                'progress': '100%',
+                'progress_text': '100%',
+                'eta': 'Done',
+                'speed': 'Done',
+                'filename': os.path.basename(final_filename),
+                'download_ready': True,
+                'status': 'finished',
+                'filepath': final_filename,
+                'download_type': 'audio'
             }
+            return
 
-        # Get direct URL without downloading
-        print(f"Getting direct URL for format: {format_type}, quality: {quality}")
+        else:
+            # Video: look the format up in the info-phase quality index - no second extraction
+            print(f"Selecting direct URL for format: {format_type}, quality: {quality}")
 
-        progress_data[download_id] = {
-            'progress': '50%',
-            'progress_text': 'Extracting download URL...',
-            'eta': '...',
-            'speed': '...',
-            'filename': filename,
-            'status': 'processing'
-        }
+            progress_data[download_id] = {
+                'progress': '50%',
+                'progress_text': 'Extracting download URL...',
+                'eta': '...',
+                'speed': '...',
+                'filename': filename,
+                'status': 'processing'
+            }
 
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            try:
-                # Extract info with format selection
-                info = ydl.extract_info(youtube_url, download=False)
-                
-                # Get available formats
-                formats = info.get('formats', [])
-                if not formats:
-                    raise Exception("No formats available for this video")
-                
-                # Try to find a suitable format
-                for fmt in reversed(formats):  # Start from highest quality
-                    if fmt.get('url'):
-                        direct_url = fmt['url']
-                        break
-                else:
-                    raise Exception("No playable format found")
-                
-                if not direct_url:
-                    raise Exception("Could not extract video URL")
-            except Exception as e:
-                print(f"Format selection error: {str(e)}")
-                # Fallback to simpler format selection
-                ydl.params['format'] = 'best'
-                info = ydl.extract_info(youtube_url, download=False)
-                direct_url = info.get('url', '')
+            with timer.stage('resolve'):
+                videos = resolve_quality_index(youtube_url, quality_index)['video']
+            with timer.stage('select'):
+                selected_format = videos.get(quality) or videos.get('best')
+            if not selected_format:
+                raise Exception("No playable format found")
 
-            # Update progress with success
-            progress_data[download_id] = {
+            height = selected_format['height']
+            record = {
                 'progress': '100%',
                 'progress_text': 'Ready for download',
                 'eta': 'Ready',
@@ -366,10 +1402,26 @@ def download_video(download_id, youtube_url, filename, original_filename, format
                 'filename': filename,
                 'download_ready': True,
                 'status': 'finished',
-                'url': direct_url,
-                'quality_info': f"{info.get('height', 'Unknown')}p" if info.get('height') else 'Unknown',
-                'filesize': info.get('filesize') or info.get('filesize_approx', 0)
+                'url': selected_format['url'],
+                'expires_at': selected_format['expires_at'],
+                'youtube_url': youtube_url,
+                'quality': quality,
+                'quality_info': f"{height}p" if height else 'Unknown',
+                'filesize': selected_format['filesize']
             }
+            if selected_format.get('audio_url'):
+                # Separate video and audio streams, muxed while streaming
+                record.update({
+                    'filename': f"{os.path.splitext(filename)[0]}.mp4",
+                    'audio_url': selected_format['audio_url'],
+                    'download_type': 'video-mux'
+                })
+            # Streams probed right after the info phase skip their redirects, with exact sizes
+            with timer.stage('select'):
+                record.update(speculative_resolver.take(selected_format))
+
+            # Update progress with success
+            progress_data[download_id] = record
 
     except Exception as e:
         error_message = str(e)
@@ -381,6 +1433,8 @@ def download_video(download_id, youtube_url, filename, original_filename, format
             error_message = "Could not find a playable video format. Please try a different quality setting."
         elif "No formats available" in error_message:
             error_message = "No video formats available. The video might be restricted or unavailable."
+        elif "per-job disk quota" in error_message:
+            error_message = "Audio file exceeds the per-job disk quota."
         
         progress_data[download_id] = {
             'progress': '0%',
@@ -391,20 +1445,362 @@ def download_video(download_id, youtube_url, filename, original_filename, format
             'status': 'error',
             'error': error_message
         }
+    finally:
+        timer.publish()
+        # Clean up progress data after 10 minutes, along with this job's workspace
+        reaper.schedule('progress_data', download_id, PROGRESS_TTL, functools.partial(remove_job_workspace, download_id))
+        schedule_url_refresh(download_id, progress_data.snapshot(download_id, {}), PROGRESS_TTL)
 
-    # Clean up progress data after 10 minutes
-    def cleanup_progress():
-        time.sleep(600)  # 10 minutes
-        if download_id in progress_data:
-            del progress_data[download_id]
-        # Also clean any files that might have been created
-        cleanup_download_directory()
+# Worker pool sizes per job class - bounds how many yt-dlp jobs run at once
+JOB_WORKERS = {
+    'info': int(os.environ.get('INFO_WORKERS', 8)),
+    'video-resolve': int(os.environ.get('VIDEO_RESOLVE_WORKERS', 8)),
+    'audio-transcode': int(os.environ.get('AUDIO_TRANSCODE_WORKERS', 2)),
+    'batch': int(os.environ.get('BATCH_WORKERS', 2)),
+    # Batch items extract on their own workers, so batches never hold up interactive lookups
+    'batch-item': int(os.environ.get('BATCH_ITEM_WORKERS', 4)),
+    'speculative': int(os.environ.get('SPECULATIVE_WORKERS', 1)),
+    # Background re-resolution of ready downloads whose signed URLs are about to expire
+    'url-refresh': int(os.environ.get('URL_REFRESH_WORKERS', 1))
+}
+JOB_QUEUE_MAX_DEPTH = int(os.environ.get('JOB_QUEUE_MAX_DEPTH', 1000))
+# Job classes with a smaller queue - their jobs are dropped rather than left to pile up
+JOB_QUEUE_DEPTHS = {
+    'speculative': int(os.environ.get('SPECULATIVE_QUEUE_DEPTH', 16))
+}
 
-    threading.Thread(target=cleanup_progress, daemon=True).start()
+class JobQueue:
+    """A job class's queue, drained by a fixed pool of worker threads"""
 
-@app.route("/", methods=["GET", "POST"])
-def index():
-    return send_from_directory('dist', 'index.html')
+    def __init__(self, name, workers, max_depth):
+        self.name = name
+        self.workers = workers
+        self.queue = queue.Queue(maxsize=max_depth)
+        self.lock = threading.Lock()
+        self.active = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+        for i in range(workers):
+            threading.Thread(target=self._worker, name=f"{name}-worker-{i}", daemon=True).start()
+
+    def submit(self, fn, *args):
+        """Queue a job, returning False if the queue is full"""
+        try:
+            self.queue.put_nowait((time.time(), fn, args))
+        except queue.Full:
+            with self.lock:
+                self.rejected += 1
+            return False
+        with self.lock:
+            self.submitted += 1
+        return True
+
+    def _worker(self):
+        while True:
+            queued_at, fn, args = self.queue.get()
+            wait = time.time() - queued_at
+            with self.lock:
+                self.active += 1
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+            try:
+                fn(*args)
+            except Exception as e:
+                print(f"Job error in {self.name} queue: {e}")
+                with self.lock:
+                    self.failed += 1
+            finally:
+                with self.lock:
+                    self.active -= 1
+                    self.completed += 1
+
+    def stats(self):
+        with self.lock:
+            started = self.completed + self.active
+            return {
+                'workers': self.workers,
+                'queue_depth': self.queue.qsize(),
+                'active': self.active,
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+                'avg_wait': round(self.total_wait / started, 3) if started else 0.0,
+                'max_wait': round(self.max_wait, 3)
+            }
+
+class JobScheduler:
+    """Routes jobs to a bounded queue per job class"""
+
+    def __init__(self, workers, max_depth, depths=None):
+        depths = depths or {}
+        self.queues = {name: JobQueue(name, count, depths.get(name, max_depth)) for name, count in workers.items()}
+
+    def submit(self, job_class, fn, *args):
+        return self.queues[job_class].submit(fn, *args)
+
+    def backlog(self, job_classes):
+        """Number of jobs waiting in the given queues"""
+        return sum(self.queues[name].queue.qsize() for name in job_classes)
+
+    def stats(self):
+        return {name: job_queue.stats() for name, job_queue in self.queues.items()}
+
+scheduler = JobScheduler(JOB_WORKERS, JOB_QUEUE_MAX_DEPTH, JOB_QUEUE_DEPTHS)
+
+# Streaming transcodes run inside /stream-download and are paced by the client, so a slot is
+# held for the whole transfer - the limit is on concurrent listeners, not on CPU-bound jobs
+STREAM_TRANSCODES = int(os.environ.get('STREAM_TRANSCODES', 16))
+transcode_slots = threading.BoundedSemaphore(STREAM_TRANSCODES)
+# Muxing only copies packets, so it is cheap - the limit just bounds open ffmpeg processes
+mux_slots = threading.BoundedSemaphore(MUX_STREAMS)
+# Batch archives run their ffmpeg entries on a pool of their own, so a long ZIP download
+# never holds the slots single downloads are waiting for
+ARCHIVE_STREAMS = int(os.environ.get('ARCHIVE_STREAMS', 4))
+archive_slots = threading.BoundedSemaphore(ARCHIVE_STREAMS)
+# The record already says "Ready for download", so a stream waits this long for a free slot
+# before giving up with 503
+STREAM_SLOT_TIMEOUT = int(os.environ.get('STREAM_SLOT_TIMEOUT', 120))
+
+# Speculative pre-resolution - after info is ready, probe the streams of the most requested
+# qualities so their redirects are followed and their connections are warm before the click
+SPECULATIVE_QUALITIES = int(os.environ.get('SPECULATIVE_QUALITIES', 2))
+SPECULATIVE_MAX_ENTRIES = 512
+
+class SpeculativeResolver:
+    """Pre-resolves likely downloads on a low-priority worker and tracks how often that pays off"""
+
+    def __init__(self, qualities, max_entries):
+        self.qualities = qualities
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.popularity = {}
+        self.entries = OrderedDict()
+        self.probes = 0
+        self.failed = 0
+        self.skipped = 0
+        self.hits = 0
+        self.misses = 0
+
+    def record_request(self, format_type, quality):
+        """Count a download request, to learn which qualities are worth speculating on"""
+        kind = 'audio' if format_type == 'audio' else 'video'
+        with self.lock:
+            self.popularity[(kind, quality)] = self.popularity.get((kind, quality), 0) + 1
+
+    def likely_qualities(self):
+        with self.lock:
+            ranked = sorted(self.popularity, key=self.popularity.get, reverse=True)
+        # Until there is some history, guess the defaults the UI preselects
+        return (ranked or [('video', 'best'), ('audio', 'high')])[:self.qualities]
+
+    def probe(self, url):
+        """Fetch the first byte of a stream, returning its final URL and total size"""
+        headers, _ = upstream_request_headers('bytes=0-0', None)
+        with upstream_session.get(url, stream=True, headers=headers, timeout=10) as upstream:
+            upstream.raise_for_status()
+            total = upstream.headers.get('Content-Range', '').rsplit('/', 1)[-1]
+            return upstream.url, int(total) if total.isdigit() else 0
+
+    def run(self, info_id):
+        # Never compete with foreground work - skip if anything user-facing is waiting
+        if scheduler.backlog(('info', 'video-resolve', 'audio-transcode')):
+            with self.lock:
+                self.skipped += 1
+            return
+
+        quality_index = video_info_data.get(info_id, {}).get('quality_index') or {}
+        urls = []
+        for kind, quality in self.likely_qualities():
+            if kind == 'audio' and not (AUDIO_STREAMING and FFMPEG_AVAILABLE):
+                continue  # Server-side audio downloads don't use the stream URL
+            entry = quality_index.get(kind, {}).get(quality)
+            if entry:
+                urls += [url for url in (entry['url'], entry.get('audio_url')) if url and url not in urls]
+
+        for url in urls:
+            with self.lock:
+                if url in self.entries:
+                    continue
+                self.probes += 1
+            try:
+                resolved_url, size = self.probe(url)
+            except (requests.exceptions.RequestException, ValueError) as e:
+                print(f"Speculative probe failed: {e}")
+                with self.lock:
+                    self.failed += 1
+                continue
+            with self.lock:
+                self.entries[url] = {'url': resolved_url, 'filesize': size}
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+
+    def take(self, entry):
+        """Fields to override on a download record for a quality index entry, counting a hit
+        if its streams were resolved ahead of time"""
+        with self.lock:
+            video = self.entries.pop(entry['url'], None)
+            audio = self.entries.pop(entry['audio_url'], None) if entry.get('audio_url') else None
+            if video is None:
+                self.misses += 1
+                return {}
+            self.hits += 1
+
+        fields = {'url': video['url']}
+        if audio:
+            fields['audio_url'] = audio['url']
+        elif video['filesize']:
+            fields['filesize'] = video['filesize']
+        return fields
+
+    def stats(self):
+        with self.lock:
+            taken = self.hits + self.misses
+            return {
+                'qualities': [f"{kind}:{quality}" for kind, quality in
+                              sorted(self.popularity, key=self.popularity.get, reverse=True)[:self.qualities]],
+                'entries': len(self.entries),
+                'probes': self.probes,
+                'failed': self.failed,
+                'skipped': self.skipped,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / taken, 3) if taken else 0.0
+            }
+
+speculative_resolver = SpeculativeResolver(SPECULATIVE_QUALITIES, SPECULATIVE_MAX_ENTRIES)
+
+# Batch extraction - playlists are capped, and each batch only runs a few items at once so
+# a large batch can't take over the batch-item workers from other batches
+BATCH_MAX_ITEMS = int(os.environ.get('BATCH_MAX_ITEMS', 200))
+BATCH_CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', 4))
+
+def is_playlist_url(url):
+    return ('youtube.com' in url or 'youtu.be' in url) and ('list=' in url or '/playlist' in url)
+
+def expand_batch_urls(urls):
+    """Expand playlist URLs into their video URLs with a flat extraction"""
+    expanded = []
+    for url in urls:
+        if not is_playlist_url(url):
+            expanded.append(url)
+            continue
+        ydl_opts = {
+            'quiet': True,
+            'no_warnings': True,
+            'extract_flat': 'in_playlist',  # List the entries without extracting each video
+            'skip_download': True,
+            'playlistend': BATCH_MAX_ITEMS
+        }
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            info = ydl.extract_info(url, download=False)
+        for entry in (info or {}).get('entries') or []:
+            if entry and entry.get('id'):
+                expanded.append(entry.get('url') or f"https://www.youtube.com/watch?v={entry['id']}")
+    return expanded[:BATCH_MAX_ITEMS]
+
+class BatchJob:
+    """Item states of a batch, published to batch_data as a fresh snapshot on every change"""
+
+    def __init__(self, batch_id):
+        self.batch_id = batch_id
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(BATCH_CONCURRENCY)
+        self.items = []
+        self.status = 'expanding'
+        self.error = None
+        self.started = time.time()
+        self.finished = None
+
+    def publish(self):
+        with self.lock:
+            done = sum(1 for item in self.items if item['status'] in ('ready', 'error'))
+            elapsed = (self.finished or time.time()) - self.started
+            record = {
+                'status': self.status,
+                'total': len(self.items),
+                'completed': sum(1 for item in self.items if item['status'] == 'ready'),
+                'failed': sum(1 for item in self.items if item['status'] == 'error'),
+                'elapsed': round(elapsed, 2),
+                'throughput': round(done / elapsed, 2) if elapsed else 0.0,  # items per second
+                'items': [dict(item) for item in self.items]
+            }
+            if self.error:
+                record['error'] = self.error
+        batch_data[self.batch_id] = record
+
+    def update_item(self, index, **fields):
+        with self.lock:
+            self.items[index].update(fields)
+        self.publish()
+
+    def finish(self, status, error=None):
+        with self.lock:
+            self.status = status
+            self.error = error
+            self.finished = time.time()
+        self.publish()
+
+def run_batch_item(batch, index):
+    """Extract one batch item into its own video info record"""
+    item = batch.items[index]
+    try:
+        batch.update_item(index, status='extracting')
+        get_video_info(item['url'], item['info_id'], speculate=False)
+        info = video_info_data.get(item['info_id'], {})
+        if info.get('status') == 'ready':
+            batch.update_item(index, status='ready', title=info.get('title'))
+        else:
+            batch.update_item(index, status='error', error=info.get('error', 'Failed to extract video info'))
+    finally:
+        batch.slots.release()
+
+def run_batch(batch_id, urls):
+    """Expand a batch, then extract its items on the batch-item workers, BATCH_CONCURRENCY at a time"""
+    batch = BatchJob(batch_id)
+    batch.publish()
+    try:
+        try:
+            urls = expand_batch_urls(urls)
+        except Exception as e:
+            batch.finish('error', f"Failed to expand playlist: {str(e)}")
+            return
+        if not urls:
+            batch.finish('error', 'No videos found')
+            return
+
+        for url in urls:
+            info_id = str(uuid.uuid4())
+            video_info_data[info_id] = {'status': 'queued'}
+            batch.items.append({'url': url, 'info_id': info_id, 'status': 'queued'})
+        batch.status = 'running'
+        batch.publish()
+
+        for index, item in enumerate(batch.items):
+            batch.slots.acquire()
+            if not scheduler.submit('batch-item', run_batch_item, batch, index):
+                batch.slots.release()
+                video_info_data[item['info_id']] = {'error': 'Server busy, please try again shortly', 'status': 'error'}
+                reaper.schedule('video_info_data', item['info_id'], VIDEO_INFO_TTL)
+                batch.update_item(index, status='error', error='Server busy, please try again shortly')
+
+        # Wait for the items still in flight
+        for _ in range(BATCH_CONCURRENCY):
+            batch.slots.acquire()
+        batch.finish('finished')
+        record = batch_data.get(batch_id, {})
+        print(f"📦 Batch {batch_id}: {record.get('total')} items in {record.get('elapsed')}s ({record.get('throughput')} items/s)")
+    finally:
+        reaper.schedule('batch_data', batch_id, VIDEO_INFO_TTL)
+
+@app.route("/", methods=["GET", "POST"])
+def index():
+    return send_from_directory('dist', 'index.html')
 
 @app.route("/watch")
 def watch_route():
@@ -427,19 +1823,62 @@ def get_video_info_route():
     
     # Initialize video info data
     video_info_data[info_id] = {
-        'status': 'starting'
+        'status': 'queued'
     }
 
-    # Start video info extraction in a thread
-    threading.Thread(target=get_video_info, args=(url, info_id)).start()
+    # Queue video info extraction on the info worker pool
+    if not scheduler.submit('info', get_video_info, url, info_id):
+        del video_info_data[info_id]
+        return jsonify({"error": "Server busy, please try again shortly"}), 503
 
     return jsonify({"info_id": info_id})
 
+def video_info_status(info_id):
+    """Public view of a video info record"""
+    video_info = video_info_data.get(info_id, {
+        "status": "unknown"
+    })
+    return video_info
+
+def status_response(status):
+    """JSON status, with the job's stage timings as a Server-Timing header once it has them"""
+    response = jsonify(status)
+    if status.get('timings'):
+        response.headers['Server-Timing'] = server_timing_header(status['timings'])
+    return response
+
 @app.route("/video-info/<info_id>")
 def check_video_info(info_id):
-    return jsonify(video_info_data.get(info_id, {
+    return status_response(video_info_status(info_id))
+
+@app.route("/get-batch-info", methods=["POST"])
+def get_batch_info_route():
+    # One URL per line (or repeated fields) - playlist URLs are expanded into their videos
+    urls = [url for value in request.form.getlist("urls") + request.form.getlist("url")
+            for url in value.split() if url]
+    if not urls:
+        return jsonify({"error": "No URLs provided"}), 400
+    if len(urls) > BATCH_MAX_ITEMS:
+        return jsonify({"error": f"Too many URLs (max {BATCH_MAX_ITEMS})"}), 400
+
+    batch_id = str(uuid.uuid4())
+    batch_data[batch_id] = {'status': 'queued', 'total': 0, 'items': []}
+
+    if not scheduler.submit('batch', run_batch, batch_id, urls):
+        del batch_data[batch_id]
+        return jsonify({"error": "Server busy, please try again shortly"}), 503
+
+    return jsonify({"batch_id": batch_id})
+
+def batch_status(batch_id):
+    """Public view of a batch record"""
+    return batch_data.get(batch_id, {
         "status": "unknown"
-    }))
+    })
+
+@app.route("/batch-info/<batch_id>")
+def check_batch_info(batch_id):
+    return jsonify(batch_status(batch_id))
 
 @app.route("/start-download", methods=["POST"])
 def start_download():
@@ -453,6 +1892,12 @@ def start_download():
     if not video_info or video_info.get('status') != 'ready':
         return jsonify({"error": "Video info not ready"}), 400
 
+    # Server-side audio downloads need disk space - refuse them above the high-water mark
+    if format_type == 'audio' and not AUDIO_STREAMING and download_dir_usage() >= DOWNLOAD_DIR_HIGH_WATER:
+        return jsonify({"error": "Server is low on disk space, please try again shortly"}), 503
+
+    speculative_resolver.record_request(format_type, quality if format_type == 'video' else audio_quality)
+
     # Use UUID for unique download IDs
     download_id = str(uuid.uuid4())
 
@@ -464,26 +1909,30 @@ def start_download():
         'speed': '...',
         'filename': video_info.get('filename', ''),
         'download_ready': False,
-        'status': 'starting',
+        'status': 'queued',
         'format': format_type,
         'quality': quality if format_type == 'video' else audio_quality
     }
 
-    # Start download in a thread
-    threading.Thread(target=download_video, args=(
-        download_id,
-        video_info.get('original_youtube_url', ''),
-        video_info.get('filename', ''),
-        video_info.get('original_filename', ''),
-        format_type,
-        quality if format_type == 'video' else audio_quality
-    )).start()
+    # Queue the download on the matching worker pool
+    # Streaming audio only needs a format lookup here - the transcode happens while streaming
+    job_class = 'audio-transcode' if format_type == 'audio' and not AUDIO_STREAMING else 'video-resolve'
+    if not scheduler.submit(job_class, download_video,
+                            download_id,
+                            video_info.get('original_youtube_url', ''),
+                            video_info.get('filename', ''),
+                            video_info.get('original_filename', ''),
+                            format_type,
+                            quality if format_type == 'video' else audio_quality,
+                            video_info.get('quality_index')):
+        del progress_data[download_id]
+        return jsonify({"error": "Server busy, please try again shortly"}), 503
 
     return jsonify({"download_id": download_id})
 
-@app.route("/progress/<download_id>")
-def check_progress(download_id):
-    return jsonify(progress_data.get(download_id, {
+def progress_status(download_id):
+    """Public view of a download progress record"""
+    return progress_data.snapshot(download_id, {
         "progress": "0%",
         "progress_text": "0.0%",
         "eta": "...",
@@ -491,7 +1940,47 @@ def check_progress(download_id):
         "filename": "",
         "download_ready": False,
         "status": "unknown"
-    }))
+    })
+
+@app.route("/progress/<download_id>")
+def check_progress(download_id):
+    return status_response(progress_status(download_id))
+
+# Server-Sent Events - push record changes instead of having the client poll
+SSE_HEARTBEAT = 15  # seconds between keep-alive comments
+
+def stream_record_events(store, key, view, final_statuses):
+    """Yield an SSE event each time the record changes, until it reaches a final status"""
+    version = -1
+    while True:
+        new_version = store.wait_for_change(key, version, SSE_HEARTBEAT)
+        if new_version == version:
+            yield ": keep-alive\n\n"
+            continue
+        version = new_version
+
+        data = view(key)
+        yield f"data: {json.dumps(data)}\n\n"
+        if data.get('status') in final_statuses or data.get('error'):
+            return
+
+def sse_response(events):
+    return Response(events, mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route("/video-info-stream/<info_id>")
+def stream_video_info(info_id):
+    return sse_response(stream_record_events(video_info_data, info_id, video_info_status, ('ready', 'error', 'unknown')))
+
+@app.route("/batch-info-stream/<batch_id>")
+def stream_batch_info(batch_id):
+    return sse_response(stream_record_events(batch_data, batch_id, batch_status, ('finished', 'error', 'unknown')))
+
+@app.route("/progress-stream/<download_id>")
+def stream_progress(download_id):
+    return sse_response(stream_record_events(progress_data, download_id, progress_status, ('finished', 'error', 'unknown')))
 
 @app.route("/system-info")
 def system_info():
@@ -499,28 +1988,699 @@ def system_info():
     return jsonify({
         "ffmpeg_available": FFMPEG_AVAILABLE,
         "supported_formats": {
-            "video": ["best", "1080", "720", "480", "360", "240"],
-            "audio": ["high", "medium", "low"] if FFMPEG_AVAILABLE else []
-        }
+            "video": VIDEO_QUALITIES,
+            "audio": list(AUDIO_QUALITIES) if FFMPEG_AVAILABLE else []
+        },
+        "info_cache": info_cache.stats(),
+        "extractions": extraction_flights.stats(),
+        "jobs": scheduler.stats(),
+        "records": reaper.stats(),
+        "upstream": upstream_session.stats(),
+        "segmented": segment_stats.stats(),
+        "audio_cache": audio_cache.stats(),
+        "workspaces": {
+            "bytes": download_dir_usage(),
+            "high_water": DOWNLOAD_DIR_HIGH_WATER,
+            "job_quota": JOB_DISK_QUOTA
+        },
+        "speculation": speculative_resolver.stats(),
+        "async_proxy": async_proxy.stats() if async_proxy else None
     })
 
-@app.route("/stream-download/<download_id>")
-def stream_download(download_id):
-    """Stream video directly to browser's download section"""
-    progress_info = progress_data.get(download_id, {})
-    
+def job_queue_samples(field):
+    return [((name,), job_queue.stats()[field]) for name, job_queue in scheduler.queues.items()]
+
+def cache_samples(field):
+    caches = {'info': info_cache, 'audio': audio_cache, 'speculative': speculative_resolver}
+    return [((name,), cache.stats()[field]) for name, cache in caches.items()]
+
+metrics.register(CallbackMetric(
+    'ytdl_jobs_queued', 'Jobs waiting in each job queue', 'gauge', ('queue',),
+    lambda: job_queue_samples('queue_depth')))
+metrics.register(CallbackMetric(
+    'ytdl_jobs_active', 'Jobs running in each job queue', 'gauge', ('queue',),
+    lambda: job_queue_samples('active')))
+metrics.register(CallbackMetric(
+    'ytdl_jobs_rejected_total', 'Jobs turned away because their queue was full', 'counter', ('queue',),
+    lambda: job_queue_samples('rejected')))
+metrics.register(CallbackMetric(
+    'ytdl_live_records', 'Records currently held in each record store', 'gauge', ('store',),
+    lambda: [((name,), len(store)) for name, store in reaper.stores.items()]))
+metrics.register(CallbackMetric(
+    'ytdl_cache_hits_total', 'Cache lookups that found an entry', 'counter', ('cache',),
+    lambda: cache_samples('hits')))
+metrics.register(CallbackMetric(
+    'ytdl_cache_misses_total', 'Cache lookups that found nothing usable', 'counter', ('cache',),
+    lambda: cache_samples('misses')))
+metrics.register(CallbackMetric(
+    'ytdl_cache_hit_ratio', 'Hits over lookups since startup', 'gauge', ('cache',),
+    lambda: cache_samples('hit_ratio')))
+
+@app.route("/metrics")
+def metrics_route():
+    """Metrics in the Prometheus text exposition format"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+# Upstream connection pooling - one keep-alive pool per googlevideo host
+UPSTREAM_POOL_HOSTS = int(os.environ.get('UPSTREAM_POOL_HOSTS', 16))
+UPSTREAM_POOL_SIZE = int(os.environ.get('UPSTREAM_POOL_SIZE', 32))
+
+class UpstreamSession:
+    """Shared requests session with keep-alive connection pools per upstream host"""
+
+    def __init__(self, pool_hosts, pool_size):
+        self.pool_hosts = pool_hosts
+        self.pool_size = pool_size
+        self.session = requests.Session()
+        # Never let one user's stream cookies leak into another user's requests
+        self.session.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+        self.adapter = requests.adapters.HTTPAdapter(pool_connections=pool_hosts, pool_maxsize=pool_size)
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+        self.lock = threading.Lock()
+        self.requests = 0
+
+    def get(self, url, **kwargs):
+        with self.lock:
+            self.requests += 1
+        return self.session.get(url, **kwargs)
+
+    def stats(self):
+        pools = self.adapter.poolmanager.pools
+        opened = 0
+        pool_requests = 0
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                opened += pool.num_connections
+                pool_requests += pool.num_requests
+        with self.lock:
+            return {
+                'requests': self.requests,
+                'host_pools': len(pools),
+                'pool_hosts': self.pool_hosts,
+                'pool_size': self.pool_size,
+                'connections_opened': opened,
+                'connections_reused': max(pool_requests - opened, 0)
+            }
+
+upstream_session = UpstreamSession(UPSTREAM_POOL_HOSTS, UPSTREAM_POOL_SIZE)
+
+def parse_range_header(value):
+    """Validate a client Range header, returning it if it is a single byte range we can forward"""
+    if not value:
+        return None
+    match = re.match(r'^bytes=(\d*)-(\d*)$', value.strip())
+    if not match or not (match.group(1) or match.group(2)):
+        # Missing, malformed or multi-range - serve the whole file instead
+        return None
+    if match.group(1) and match.group(2) and int(match.group(2)) < int(match.group(1)):
+        return None
+    return value.strip()
+
+# Segmented upstream fetching - opt-in, splits a stream into parallel ranged requests to get
+# past per-connection throttling. Memory per stream is bounded by SEGMENT_COUNT * SEGMENT_SIZE
+SEGMENTED_DOWNLOADS = os.environ.get('SEGMENTED_DOWNLOADS') == '1'
+SEGMENT_COUNT = int(os.environ.get('SEGMENT_COUNT', 4))
+SEGMENT_SIZE = int(os.environ.get('SEGMENT_SIZE', 2 * 1024 * 1024))
+
+class SegmentStats:
+    """Throughput of fetched segments, overall and for the most recent ones"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.segments = 0
+        self.failed = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self.recent = deque(maxlen=50)
+
+    def record(self, size, seconds):
+        with self.lock:
+            self.segments += 1
+            self.bytes += size
+            self.seconds += seconds
+            self.recent.append(round(size / seconds) if seconds else 0)
+
+    def record_failure(self):
+        with self.lock:
+            self.failed += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                'enabled': SEGMENTED_DOWNLOADS,
+                'segment_count': SEGMENT_COUNT,
+                'segment_size': SEGMENT_SIZE,
+                'segments': self.segments,
+                'failed': self.failed,
+                'bytes': self.bytes,
+                'avg_throughput': round(self.bytes / self.seconds) if self.seconds else 0,
+                'recent_throughput': list(self.recent)
+            }
+
+segment_stats = SegmentStats()
+
+def requested_span(range_header):
+    """Start and end (None when open-ended) of a 'bytes=a-b' range, or None for suffix ranges"""
+    match = re.match(r'^bytes=(\d+)-(\d*)$', range_header)
+    if not match:
+        return None
+    return int(match.group(1)), int(match.group(2)) if match.group(2) else None
+
+def fetch_segment(url, headers, start, end):
+    """Fetch one byte range of the upstream URL in full"""
+    segment_headers = {k: v for k, v in headers.items() if k != 'If-Range'}
+    segment_headers['Range'] = f'bytes={start}-{end}'
+    started = time.time()
+    try:
+        length = end - start + 1
+        with upstream_session.get(url, headers=segment_headers, stream=True, timeout=60) as r:
+            r.raise_for_status()
+            # An upstream that ignores Range would send the whole file - check before reading any of it
+            content_range = r.headers.get('Content-Range', '')
+            if r.status_code != 206 or not content_range.startswith(f'bytes {start}-{end}/'):
+                raise requests.exceptions.RequestException(f"Bad segment response for bytes {start}-{end}")
+            data = bytearray()
+            for chunk in r.iter_content(chunk_size=min(length, 64 * 1024)):
+                data += chunk
+                if len(data) >= length:
+                    break
+        if len(data) != length:
+            raise requests.exceptions.RequestException(f"Short segment response for bytes {start}-{end}")
+        data = bytes(data)
+    except requests.exceptions.RequestException:
+        segment_stats.record_failure()
+        raise
+    segment_stats.record(len(data), time.time() - started)
+    return data
+
+class SegmentedFetch:
+    """Fetches bytes start..end of the upstream URL as SEGMENT_COUNT concurrent ranged requests,
+    starting as soon as it is created. Iterating yields the segments in order; finished
+    segments wait in a reorder buffer of at most SEGMENT_COUNT entries"""
+
+    def __init__(self, url, headers, start, end):
+        self.url = url
+        self.headers = headers
+        self.ranges = iter([(s, min(s + SEGMENT_SIZE - 1, end)) for s in range(start, end + 1, SEGMENT_SIZE)])
+        self.executor = ThreadPoolExecutor(max_workers=SEGMENT_COUNT, thread_name_prefix="segment")
+        self.pending = deque()
+        for segment in itertools.islice(self.ranges, SEGMENT_COUNT):
+            self._submit(segment)
+
+    def _submit(self, segment):
+        self.pending.append(self.executor.submit(fetch_segment, self.url, self.headers, *segment))
+
+    def __iter__(self):
+        try:
+            while self.pending:
+                data = self.pending.popleft().result()
+                segment = next(self.ranges, None)
+                if segment:
+                    self._submit(segment)
+                yield data
+        finally:
+            self.close()
+
+    def close(self):
+        for future in self.pending:
+            future.cancel()
+        self.pending.clear()
+        self.executor.shutdown(wait=False)
+
+# Transcoded audio cache - kept apart from DOWNLOAD_DIR so download cleanup never wipes it
+AUDIO_CACHE_DIR = os.environ.get('AUDIO_CACHE_DIR', 'audio_cache')
+AUDIO_CACHE_BYTES = int(os.environ.get('AUDIO_CACHE_BYTES', 1024 ** 3))
+
+class AudioCacheWriter:
+    """Collects a transcode into a temp file that only becomes a cache entry on commit"""
+
+    def __init__(self, cache, key, temp_path):
+        self.cache = cache
+        self.key = key
+        self.temp_path = temp_path
+        self.file = open(temp_path, 'wb')
+        self.done = False
+
+    def write(self, chunk):
+        # A failing cache (e.g. a full disk) only loses the cache entry, never the download
+        if self.done:
+            return
+        try:
+            self.file.write(chunk)
+        except OSError as e:
+            print(f"Audio cache write error: {e}")
+            self.discard()
+
+    def commit(self):
+        if not self.done:
+            self.done = True
+            try:
+                self.file.close()
+                self.cache._commit(self.key, self.temp_path)
+            except OSError as e:
+                print(f"Audio cache write error: {e}")
+                self.cache._abandon(self.key, self.temp_path)
+
+    def discard(self):
+        if not self.done:
+            self.done = True
+            try:
+                self.file.close()
+            except OSError:
+                pass
+            self.cache._abandon(self.key, self.temp_path)
+
+class AudioCache:
+    """On-disk LRU cache of transcoded audio keyed by (video ID, codec, bitrate).
+
+    Files are named by a hash of the key and only appear via an atomic rename, so readers
+    never see partial files. Evicted files are unlinked, which doesn't disturb readers that
+    already have them open. The directory itself is the index - a hit sets the file's access
+    time for LRU order - so worker processes sharing it see the same entries and one budget."""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.writing = set()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(directory, exist_ok=True)
+        # Drop unfinished writes from a previous run - younger ones may be a sibling worker's
+        for _, path, _ in self._scan(temp=True):
+            try:
+                if time.time() - os.path.getmtime(path) >= STALE_FILE_AGE:
+                    os.unlink(path)
+            except OSError:
+                pass
+        self._evict()
+
+    def _scan(self, temp=False):
+        """(access time, path, size) of every entry, or of every unfinished write"""
+        files = []
+        for name in os.listdir(self.directory):
+            if name.startswith('.tmp-') != temp:
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_atime, path, stat.st_size))
+        return files
+
+    def path_for(self, key):
+        video_id, codec, bitrate = key
+        digest = hashlib.sha256(f"{video_id}:{codec}:{bitrate}".encode()).hexdigest()
+        return os.path.join(self.directory, f"{digest}.{codec}")
+
+    def get(self, key):
+        """Return the cached file for key, opened for reading, or None. The caller closes it"""
+        path = self.path_for(key)
+        try:
+            cached_file = open(path, 'rb')
+        except OSError:
+            with self.lock:
+                self.misses += 1
+            return None
+        try:
+            # Only the access time moves, so the file's ETag stays the same
+            os.utime(path, (time.time(), os.fstat(cached_file.fileno()).st_mtime))
+        except OSError:
+            pass
+        with self.lock:
+            self.hits += 1
+        return cached_file
+
+    def writer(self, key):
+        """Start caching a transcode for key, or None if another writer already is"""
+        with self.lock:
+            if key in self.writing:
+                return None
+            self.writing.add(key)
+        try:
+            return AudioCacheWriter(self, key, os.path.join(self.directory, f".tmp-{uuid.uuid4()}"))
+        except OSError as e:
+            print(f"Audio cache write error: {e}")
+            with self.lock:
+                self.writing.discard(key)
+            return None
+
+    def store(self, key, source_path):
+        """Copy a finished transcode into the cache"""
+        writer = self.writer(key)
+        if writer is None:
+            return
+        try:
+            with open(source_path, 'rb') as f:
+                shutil.copyfileobj(f, writer.file)
+            writer.commit()
+        except OSError as e:
+            print(f"Audio cache write error: {e}")
+            writer.discard()
+
+    def _commit(self, key, temp_path):
+        try:
+            os.replace(temp_path, self.path_for(key))
+        finally:
+            with self.lock:
+                self.writing.discard(key)
+        self._evict()
+
+    def _abandon(self, key, temp_path):
+        with self.lock:
+            self.writing.discard(key)
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+
+    def _evict(self):
+        """Unlink the least recently used entries until the directory fits the budget"""
+        files = sorted(self._scan())
+        total_bytes = sum(size for _, _, size in files)
+        for _, path, size in files:
+            if total_bytes <= self.max_bytes:
+                break
+            total_bytes -= size
+            try:
+                os.unlink(path)
+            except OSError:
+                # Another worker got there first
+                continue
+            with self.lock:
+                self.evictions += 1
+
+    def stats(self):
+        files = self._scan()
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(files),
+                'bytes': sum(size for _, _, size in files),
+                'max_bytes': self.max_bytes,
+                'writing': len(self.writing),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': round(self.hits / lookups, 3) if lookups else 0.0
+            }
+
+audio_cache = AudioCache(AUDIO_CACHE_DIR, AUDIO_CACHE_BYTES)
+
+def ffmpeg_command(inputs, output_args):
+    """ffmpeg arguments reading the given inputs and writing to stdout"""
+    command = ['ffmpeg', '-hide_banner', '-loglevel', 'error']
+    for source in inputs:
+        command += ['-i', source]
+    return command + output_args
+
+def mp3_output_args(bitrate):
+    """Transcode the audio of the first input to MP3"""
+    return ['-vn', '-c:a', 'libmp3lame', '-b:a', f'{bitrate}k', '-f', 'mp3', 'pipe:1']
+
+# Copy video from the first input and audio from the second into fragmented MP4, which
+# can be written to a pipe since it doesn't need seeking back to the start
+MUX_OUTPUT_ARGS = [
+    '-map', '0:v:0', '-map', '1:a:0', '-c', 'copy',
+    '-f', 'mp4', '-movflags', 'frag_keyframe+empty_moov+default_base_moof', 'pipe:1'
+]
+
+class FFmpegPipeStream:
+    """Feeds one or more upstream streams into ffmpeg and yields its stdout as it is produced.
+    Every input gets its own OS pipe and feeder thread, so nothing touches the disk"""
+
+    def __init__(self, urls, output_args, on_close=None, cache_writer=None, timer=None):
+        self.on_close = on_close
+        self.cache_writer = cache_writer
+        self.closed = False
+        self.feed_error = None
+        self.upstreams = []
+        timer = timer or StageTimer('ffmpeg', None)
+        headers, _ = upstream_request_headers(None, None)
+        try:
+            with timer.stage('upstream'):
+                for url in urls:
+                    upstream = upstream_session.get(url, stream=True, headers=headers, timeout=60)
+                    self.upstreams.append(upstream)
+                    upstream.raise_for_status()
+        except requests.exceptions.RequestException:
+            for upstream in self.upstreams:
+                upstream.close()
+            if cache_writer:
+                cache_writer.discard()
+            raise
+
+        pipes = [os.pipe() for _ in urls]
+        try:
+            with timer.stage('spawn'):
+                self.ffmpeg = subprocess.Popen(ffmpeg_command([f'pipe:{read_fd}' for read_fd, _ in pipes], output_args),
+                                               stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                               pass_fds=[read_fd for read_fd, _ in pipes])
+        except OSError:
+            for upstream in self.upstreams:
+                upstream.close()
+            for write_fd in [write_fd for _, write_fd in pipes]:
+                os.close(write_fd)
+            if cache_writer:
+                cache_writer.discard()
+            raise
+        finally:
+            # ffmpeg holds its own copies of the read ends
+            for read_fd, _ in pipes:
+                os.close(read_fd)
+
+        for upstream, (_, write_fd) in zip(self.upstreams, pipes):
+            threading.Thread(target=self._feed, args=(upstream, write_fd), name="ffmpeg-feed", daemon=True).start()
+
+    def _feed(self, upstream, write_fd):
+        pipe = open(write_fd, 'wb')
+        try:
+            for chunk in upstream.iter_content(chunk_size=64 * 1024):
+                if chunk:
+                    pipe.write(chunk)
+        except requests.exceptions.RequestException as e:
+            # The upstream failed partway. Closing the pipe would look like the end of the input,
+            # so ffmpeg is stopped first and the output can't pass for a complete file
+            if not self.closed:
+                self.feed_error = e
+                self.ffmpeg.kill()
+            print(f"ffmpeg feed stopped: {e}")
+        except (OSError, ValueError) as e:
+            # The client went away and ffmpeg was stopped
+            print(f"ffmpeg feed stopped: {e}")
+        finally:
+            try:
+                pipe.close()
+            except OSError:
+                pass
+            upstream.close()
+
+    def __iter__(self):
+        try:
+            while True:
+                chunk = self.ffmpeg.stdout.read1(64 * 1024)
+                if not chunk:
+                    break
+                if self.cache_writer:
+                    self.cache_writer.write(chunk)
+                yield chunk
+            if self.ffmpeg.wait() != 0 or self.feed_error:
+                # Raising drops the connection, so the client sees a failed download, not a short file
+                raise Exception(f"ffmpeg output incomplete (exit code {self.ffmpeg.returncode}): {self.feed_error}")
+            if self.cache_writer:
+                # Only a complete, successful transcode becomes a cache entry
+                self.cache_writer.commit()
+        finally:
+            self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self.ffmpeg.poll() is None:
+            self.ffmpeg.kill()
+        self.ffmpeg.wait()
+        self.ffmpeg.stdout.close()
+        for upstream in self.upstreams:
+            upstream.close()
+        if self.cache_writer:
+            self.cache_writer.discard()
+        if self.on_close:
+            self.on_close()
+
+def remove_served_file(filepath):
+    """Delete an audio file once it has been handed to the client, along with its job workspace"""
+    try:
+        os.unlink(filepath)
+        print(f"🗑️ Cleaned up audio file: {os.path.basename(filepath)}")
+    except Exception as e:
+        print(f"Error cleaning up file {filepath}: {e}")
+
+    workspace = os.path.dirname(os.path.abspath(filepath))
+    if os.path.dirname(workspace) == os.path.abspath(DOWNLOAD_DIR):
+        shutil.rmtree(workspace, ignore_errors=True)
+
+def send_cached_audio(cached_file, filename):
+    """send_file for an open audio cache file - send_file only works out the size, and so
+    range support, for paths"""
+    stat = os.fstat(cached_file.fileno())
+    response = send_file(cached_file, mimetype='audio/mpeg', as_attachment=True, download_name=filename,
+                         etag=f"{stat.st_mtime}-{stat.st_size}", last_modified=stat.st_mtime, conditional=False)
+    response.content_length = stat.st_size
+    response.headers['Cache-Control'] = 'no-cache'
+    try:
+        return response.make_conditional(request.environ, accept_ranges=True, complete_length=stat.st_size)
+    except RequestedRangeNotSatisfiable:
+        cached_file.close()
+        raise
+
+def stream_urls_expiring(progress_info):
+    """True if a download's signed stream URLs are expired or about to be"""
+    expires_at = progress_info.get('expires_at')
+    return bool(expires_at and progress_info.get('youtube_url') and
+                expires_at - STREAM_URL_MIN_LIFETIME <= time.time())
+
+def upstream_forbidden(error):
+    """True if a request failed because the upstream rejected the signed URL"""
+    response = getattr(error, 'response', None)
+    return response is not None and response.status_code == 403
+
+def refresh_download_urls(download_id, progress_info):
+    """Re-resolve a download's stream URLs from a fresh extraction, returning the updated record.
+    On failure the record is returned unchanged and the stream fails as it would have"""
+    youtube_url = progress_info.get('youtube_url')
+    if not youtube_url:
+        return progress_info
+    try:
+        info_cache.invalidate(get_video_id(youtube_url), progress_info.get('url'))
+        quality_index = resolve_quality_index(youtube_url, None)
+        quality = progress_info.get('quality', 'best')
+        if progress_info.get('download_type') in ('audio-stream', 'audio-cached'):
+            entry = quality_index['audio'].get(quality)
+            # An evicted cache entry is transcoded again
+            fields = {'download_type': 'audio-stream'}
+        else:
+            entry = quality_index['video'].get(quality) or quality_index['video'].get('best')
+            # Fresh formats may no longer need muxing at this quality, or the other way round
+            fields = {'download_type': 'video-mux' if entry and entry.get('audio_url') else 'video'}
+        if not entry:
+            raise Exception("No playable format found")
+
+        fields.update({'url': entry['url'], 'expires_at': entry['expires_at']})
+        if entry.get('audio_url'):
+            fields['audio_url'] = entry['audio_url']
+        progress_data.merge(download_id, fields)
+        print(f"🔄 Refreshed stream URLs for download {download_id}")
+        progress_info = progress_data.snapshot(download_id, progress_info)
+        schedule_url_refresh(download_id, progress_info, PROGRESS_TTL)
+        return progress_info
+    except Exception as e:
+        print(f"Stream URL refresh failed for download {download_id}: {e}")
+        return progress_info
+
+def schedule_url_refresh(download_id, progress_info, ttl):
+    """Re-resolve a ready download's stream URLs in the background once they get within
+    STREAM_URL_MIN_LIFETIME of expiry, so /stream-download doesn't do it while the client waits.
+    Refreshes due after the record's ttl are never needed and aren't scheduled"""
+    expires_at = progress_info.get('expires_at')
+    if progress_info.get('status') != 'finished' or not expires_at or not progress_info.get('youtube_url'):
+        return
+    delay = max(0, expires_at - STREAM_URL_MIN_LIFETIME - time.time())
+    if delay < ttl:
+        reaper.call_later(delay, lambda: scheduler.submit('url-refresh', refresh_expiring_urls, download_id, expires_at))
+
+def refresh_expiring_urls(download_id, expires_at):
+    progress_info = progress_data.snapshot(download_id, {})
+    # Skip records that expired, or whose URLs a stream already refreshed
+    if progress_info.get('expires_at') == expires_at:
+        refresh_download_urls(download_id, progress_info)
+
+def download_not_ready_error(progress_info):
+    """Explain why a download record can't be streamed yet, or None if it can"""
     if progress_info.get('status') == 'starting':
-        return jsonify({"error": "Download not started yet"}), 400
-    
+        return "Download not started yet"
+
     if progress_info.get('status') == 'downloading':
-        return jsonify({"error": "Download in progress, please wait"}), 400
-    
+        return "Download in progress, please wait"
+
     if progress_info.get('status') == 'error':
-        return jsonify({"error": "Download failed"}), 400
-    
+        return "Download failed"
+
     if not progress_info.get('download_ready'):
-        return jsonify({"error": "Download not ready yet"}), 400
-    
+        return "Download not ready yet"
+
+    return None
+
+def upstream_request_headers(range_header, if_range):
+    """Build the headers for a YouTube stream request, forwarding a valid client byte range"""
+    headers = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+        'Accept': '*/*',
+        'Accept-Language': 'en-US,en;q=0.9',
+        'Accept-Encoding': 'identity',
+        'Range': 'bytes=0-',
+        'Connection': 'keep-alive',
+        'Referer': 'https://www.youtube.com/',
+    }
+
+    client_range = parse_range_header(range_header)
+    if client_range:
+        headers['Range'] = client_range
+        if if_range:
+            headers['If-Range'] = if_range
+    return headers, client_range
+
+def attachment_disposition(filename):
+    """Content-Disposition value with a safe, properly encoded filename"""
+    safe_filename = quote(filename)
+    return f'attachment; filename="{filename}"; filename*=UTF-8\'\'{safe_filename}'
+
+def proxy_response_headers(filename, upstream_status, upstream_headers, client_range):
+    """Work out the status and headers for relaying an upstream video response to the client"""
+    response_headers = {
+        'Content-Disposition': attachment_disposition(filename),
+        'Cache-Control': 'no-cache',
+        'Accept-Ranges': 'bytes',
+        'Connection': 'keep-alive'
+    }
+    for name in ('Content-Length', 'ETag', 'Last-Modified'):
+        if upstream_headers.get(name):
+            response_headers[name] = upstream_headers[name]
+
+    status = 200
+    content_range = upstream_headers.get('Content-Range', '')
+    if upstream_status == 206:
+        if client_range:
+            status = 206
+            response_headers['Content-Range'] = content_range
+        else:
+            # We asked for bytes=0- ourselves - the client is getting the whole file
+            total = content_range.rsplit('/', 1)[-1]
+            if total.isdigit():
+                response_headers['Content-Length'] = total
+
+    return status, response_headers
+
+@app.route("/stream-download/<download_id>")
+def stream_download(download_id, retried=False, timer=None):
+    """Stream video directly to browser's download section"""
+    timer = timer or StageTimer('stream', download_id, progress_data, 'stream_timings')
+    progress_info = progress_data.snapshot(download_id, {})
+
+    error = download_not_ready_error(progress_info)
+    if error:
+        return jsonify({"error": error}), 400
+
+    # Re-resolve URLs that are about to expire instead of letting the upstream reject them
+    if not retried and stream_urls_expiring(progress_info):
+        with timer.stage('refresh'):
+            progress_info = refresh_download_urls(download_id, progress_info)
+
     filename = progress_info.get('filename', 'video.mp4')
     download_type = progress_info.get('download_type', 'video')
 
@@ -532,46 +2692,173 @@ def stream_download(download_id):
             if not direct_url:
                 return jsonify({"error": "No download URL available"}), 404
 
+            # Pass the client's byte range (and its If-Range validator) through to YouTube
+            headers, client_range = upstream_request_headers(request.headers.get('Range'), request.headers.get('If-Range'))
+
+            # Segmented mode: only the first segment comes from this request, the rest of the
+            # span is fetched as parallel ranged requests once the total size is known
+            span = requested_span(headers['Range']) if SEGMENTED_DOWNLOADS else None
+            if span:
+                span_start, span_end = span
+                first_end = span_start + SEGMENT_SIZE - 1
+                if span_end is not None:
+                    first_end = min(first_end, span_end)
+                headers['Range'] = f'bytes={span_start}-{first_end}'
+
+            with timer.stage('upstream'):
+                upstream = upstream_session.get(direct_url, stream=True, headers=headers, timeout=60)
+
+            if upstream.status_code == 403 and not retried and progress_info.get('youtube_url'):
+                # The signed URL was rejected - re-resolve it once and start over
+                upstream.close()
+                with timer.stage('refresh'):
+                    refresh_download_urls(download_id, progress_info)
+                return stream_download(download_id, retried=True, timer=timer)
+
+            if upstream.status_code == 416:
+                content_range = upstream.headers.get('Content-Range', 'bytes */*')
+                upstream.close()
+                return Response(status=416, headers={'Content-Range': content_range})
+
+            try:
+                upstream.raise_for_status()
+            except requests.exceptions.RequestException:
+                upstream.close()
+                raise
+
+            relay_headers = upstream.headers
+            remainder = None
+            if span and upstream.status_code == 206:
+                total = upstream.headers.get('Content-Range', '').rsplit('/', 1)[-1]
+                if total.isdigit():
+                    span_end = int(total) - 1 if span_end is None else min(span_end, int(total) - 1)
+                    relay_headers = dict(upstream.headers)
+                    relay_headers['Content-Range'] = f'bytes {span_start}-{span_end}/{total}'
+                    relay_headers['Content-Length'] = str(span_end - span_start + 1)
+                    if first_end < span_end:
+                        remainder = (first_end + 1, span_end)
+                else:
+                    # Without a total size the span can't be split - fall back to a single request
+                    upstream.close()
+                    headers, client_range = upstream_request_headers(request.headers.get('Range'), request.headers.get('If-Range'))
+                    with timer.stage('upstream'):
+                        upstream = upstream_session.get(direct_url, stream=True, headers=headers, timeout=60)
+                    upstream.raise_for_status()
+                    relay_headers = upstream.headers
+
+            # Start fetching the rest of the span while the first segment is relayed
+            segments = SegmentedFetch(direct_url, headers, *remainder) if remainder else None
+
             # Stream the video directly from YouTube to browser
             def generate():
-                headers = {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-                    'Accept': '*/*',
-                    'Accept-Language': 'en-US,en;q=0.9',
-                    'Accept-Encoding': 'identity',
-                    'Range': 'bytes=0-',
-                    'Connection': 'keep-alive',
-                    'Referer': 'https://www.youtube.com/',
-                }
-
                 try:
-                    with requests.get(direct_url, stream=True, headers=headers, timeout=60) as r:
-                        r.raise_for_status()
+                    for chunk in upstream.iter_content(chunk_size=8192):
+                        if chunk:
+                            yield chunk
+                    upstream.close()
 
-                        for chunk in r.iter_content(chunk_size=8192):
-                            if chunk:
-                                yield chunk
+                    if segments:
+                        yield from segments
 
                 except requests.exceptions.RequestException as e:
                     print(f"Request error: {e}")
                     raise e
+                finally:
+                    upstream.close()
+                    if segments:
+                        segments.close()
 
-            # Create safe headers with proper encoding
-            safe_filename = quote(filename)
-            content_disposition = f'attachment; filename="{filename}"; filename*=UTF-8\'\'{safe_filename}'
+            status, response_headers = proxy_response_headers(filename, upstream.status_code, relay_headers, client_range)
+            response_headers['Server-Timing'] = server_timing_header(timer.timings())
 
             response = Response(
-                generate(),
+                MeteredStream(generate(), 'video', timer),
+                status=status,
+                mimetype='video/mp4',
+                headers=response_headers
+            )
+
+            return response
+
+        elif download_type == 'video-mux':
+            # Video: copy the separate video and audio streams into one fragmented MP4 as they arrive
+            video_url = progress_info.get('url', '')
+            audio_url = progress_info.get('audio_url', '')
+
+            if not video_url or not audio_url:
+                return jsonify({"error": "No download URL available"}), 404
+
+            with timer.stage('queue'):
+                acquired = mux_slots.acquire(timeout=STREAM_SLOT_TIMEOUT)
+            if not acquired:
+                return jsonify({"error": "Server busy, please try again shortly"}), 503
+            try:
+                mux = FFmpegPipeStream([video_url, audio_url], MUX_OUTPUT_ARGS, mux_slots.release, timer=timer)
+            except Exception as e:
+                mux_slots.release()
+                if upstream_forbidden(e) and not retried:
+                    with timer.stage('refresh'):
+                        refresh_download_urls(download_id, progress_info)
+                    return stream_download(download_id, retried=True, timer=timer)
+                raise
+
+            # The muxed size isn't known up front, so there is no Content-Length and no ranges
+            return Response(
+                MeteredStream(mux, 'video', timer),
                 mimetype='video/mp4',
                 headers={
-                    'Content-Disposition': content_disposition,
+                    'Content-Disposition': attachment_disposition(filename),
                     'Cache-Control': 'no-cache',
-                    'Accept-Ranges': 'bytes',
-                    'Connection': 'keep-alive'
+                    'Accept-Ranges': 'none',
+                    'Server-Timing': server_timing_header(timer.timings())
                 }
             )
 
-            return response
+        elif download_type in ('audio-stream', 'audio-cached'):
+            # Audio: serve a cached transcode when there is one
+            cache_key = (progress_info.get('video_id'), 'mp3', progress_info.get('bitrate', '192'))
+            cached_file = audio_cache.get(cache_key)
+            if cached_file:
+                response = send_cached_audio(cached_file, filename)
+                response.headers['Server-Timing'] = server_timing_header(timer.timings())
+                return response
+
+            # Otherwise transcode to MP3 on the fly - no intermediate files
+            if not progress_info.get('url') and not retried:
+                # The cached transcode was evicted after the job finished
+                with timer.stage('refresh'):
+                    progress_info = refresh_download_urls(download_id, progress_info)
+            direct_url = progress_info.get('url', '')
+
+            if not direct_url:
+                return jsonify({"error": "No download URL available"}), 404
+
+            with timer.stage('queue'):
+                acquired = transcode_slots.acquire(timeout=STREAM_SLOT_TIMEOUT)
+            if not acquired:
+                return jsonify({"error": "Server busy, please try again shortly"}), 503
+            try:
+                transcode = FFmpegPipeStream([direct_url], mp3_output_args(cache_key[2]), transcode_slots.release,
+                                             audio_cache.writer(cache_key), timer)
+            except Exception as e:
+                transcode_slots.release()
+                if upstream_forbidden(e) and not retried:
+                    with timer.stage('refresh'):
+                        refresh_download_urls(download_id, progress_info)
+                    return stream_download(download_id, retried=True, timer=timer)
+                raise
+
+            # The WSGI server calls transcode.close() when the response ends, even if the client left early
+            return Response(
+                MeteredStream(transcode, 'audio', timer),
+                mimetype='audio/mpeg',
+                headers={
+                    'Content-Disposition': attachment_disposition(filename),
+                    'Cache-Control': 'no-cache',
+                    'Accept-Ranges': 'none',
+                    'Server-Timing': server_timing_header(timer.timings())
+                }
+            )
 
         else:
             # Audio: Serve file from server then delete it
@@ -587,42 +2874,545 @@ def stream_download(download_id):
             else:
                 mimetype = 'application/octet-stream'
 
-            # Create a custom response that deletes the file after serving
-            def generate_and_cleanup():
-                try:
-                    with open(filepath, 'rb') as f:
-                        while True:
-                            chunk = f.read(8192)
-                            if not chunk:
-                                break
-                            yield chunk
-                finally:
-                    # Delete the file after serving
-                    try:
-                        if os.path.exists(filepath):
-                            os.unlink(filepath)
-                            print(f"🗑️ Cleaned up audio file: {os.path.basename(filepath)}")
-                    except Exception as e:
-                        print(f"Error cleaning up file {filepath}: {e}")
-
-            # Create safe headers with proper encoding
-            safe_filename = quote(filename)
-            content_disposition = f'attachment; filename="{filename}"; filename*=UTF-8\'\'{safe_filename}'
-
-            response = Response(
-                generate_and_cleanup(),
+            # Serve through send_file so the WSGI server can use its file wrapper (sendfile)
+            # instead of pushing every chunk through Python, with conditional and range support
+            response = send_file(
+                os.path.abspath(filepath),
                 mimetype=mimetype,
-                headers={
-                    'Content-Disposition': content_disposition,
-                    'Cache-Control': 'no-cache'
-                }
+                as_attachment=True,
+                download_name=filename,
+                conditional=True
             )
+            response.headers['Cache-Control'] = 'no-cache'
+            response.headers['Server-Timing'] = server_timing_header(timer.timings())
+
+            # The file stays for HEAD requests, resumed (range) requests and retries after a
+            # dropped transfer - the job's expiry removes its workspace with the file in it
 
             return response
 
     except Exception as e:
         print(f"File serving error: {e}")
+        timer.publish()
         return jsonify({"error": f"Error serving file: {str(e)}"}), 500
 
+# Batch archives wait this long for a free ffmpeg slot before skipping an entry
+ARCHIVE_SLOT_TIMEOUT = int(os.environ.get('ARCHIVE_SLOT_TIMEOUT', 300))
+
+class ZipStreamBuffer:
+    """Write-only file object that collects zipfile output until the generator yields it.
+    It has no tell() or seek(), so zipfile writes each entry's sizes in a data descriptor"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+def wait_for_video_info(info_id):
+    """Block until a batch item's info record is final"""
+    version = -1
+    while True:
+        info = video_info_data.get(info_id, {})
+        if info.get('status') not in ('queued', 'starting'):
+            return info
+        version = video_info_data.wait_for_change(info_id, version, SSE_HEARTBEAT)
+
+def iter_file(f):
+    with f:
+        while True:
+            chunk = f.read(64 * 1024)
+            if not chunk:
+                return
+            yield chunk
+
+def open_upstream(url):
+    """Start an upstream request, raising before any entry is written if it is rejected"""
+    headers, _ = upstream_request_headers(None, None)
+    upstream = upstream_session.get(url, stream=True, headers=headers, timeout=60)
+    try:
+        upstream.raise_for_status()
+    except requests.exceptions.RequestException:
+        upstream.close()
+        raise
+    return upstream
+
+def iter_upstream(upstream):
+    with upstream:
+        for chunk in upstream.iter_content(chunk_size=64 * 1024):
+            if chunk:
+                yield chunk
+
+def open_archive_entry(info, format_type, quality):
+    """Return (entry name, chunk iterator) for one batch item, or None to skip it"""
+    base_name = os.path.splitext(info.get('filename') or 'video')[0]
+    quality_index = info.get('quality_index') or {}
+
+    if format_type == 'audio':
+        entry = quality_index.get('audio', {}).get(quality)
+        if not entry or not FFMPEG_AVAILABLE:
+            return None
+        cache_key = (get_video_id(info.get('original_youtube_url', '')), 'mp3', entry['bitrate'])
+        cached_file = audio_cache.get(cache_key)
+        if cached_file:
+            return f"{base_name}.mp3", iter_file(cached_file)
+        if not archive_slots.acquire(timeout=ARCHIVE_SLOT_TIMEOUT):
+            return None
+        try:
+            return f"{base_name}.mp3", FFmpegPipeStream([entry['url']], mp3_output_args(entry['bitrate']),
+                                                        archive_slots.release, audio_cache.writer(cache_key))
+        except Exception:
+            archive_slots.release()
+            raise
+
+    videos = quality_index.get('video', {})
+    entry = videos.get(quality) or videos.get('best')
+    if not entry:
+        return None
+    if entry.get('audio_url'):
+        if not archive_slots.acquire(timeout=ARCHIVE_SLOT_TIMEOUT):
+            return None
+        try:
+            return f"{base_name}.mp4", FFmpegPipeStream([entry['url'], entry['audio_url']], MUX_OUTPUT_ARGS,
+                                                        archive_slots.release)
+        except Exception:
+            archive_slots.release()
+            raise
+    return f"{base_name}.{entry['ext'] or 'mp4'}", iter_upstream(open_upstream(entry['url']))
+
+def refresh_archive_info(info, failed_url):
+    """The info record with its quality index re-resolved from a fresh extraction"""
+    youtube_url = info.get('original_youtube_url', '')
+    info_cache.invalidate(get_video_id(youtube_url), failed_url)
+    return dict(info, quality_index=resolve_quality_index(youtube_url, None))
+
+def stream_batch_archive(items, format_type, quality):
+    """Yield a ZIP of the batch's files as they are fetched - stored (no compression, the media
+    is already compressed) and ZIP64, so memory stays at one chunk whatever the archive size"""
+    buffer = ZipStreamBuffer()
+    names = set()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED, allowZip64=True) as archive:
+        for item in items:
+            info = wait_for_video_info(item['info_id'])
+            if info.get('status') != 'ready':
+                continue
+            try:
+                try:
+                    opened = open_archive_entry(info, format_type, quality)
+                except requests.exceptions.RequestException as e:
+                    if not upstream_forbidden(e) or not info.get('original_youtube_url'):
+                        raise
+                    # The signed URLs were rejected - re-resolve them once, as single streams do
+                    opened = open_archive_entry(refresh_archive_info(info, e.response.url), format_type, quality)
+            except Exception as e:
+                print(f"Archive entry error for {item['url']}: {e}")
+                continue
+            if not opened:
+                print(f"Skipping archive entry for {item['url']}")
+                continue
+
+            name, chunks = opened
+            stem, ext = os.path.splitext(name)
+            counter = 1
+            while name in names:
+                counter += 1
+                name = f"{stem}_{counter}{ext}"
+            names.add(name)
+
+            entry_info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+            try:
+                # force_zip64 because the entry size isn't known until it has been written
+                with archive.open(entry_info, 'w', force_zip64=True) as entry:
+                    for chunk in chunks:
+                        entry.write(chunk)
+                        yield buffer.drain()
+            except Exception as e:
+                # A cut-off entry would look complete inside the ZIP - fail the whole download
+                # instead (the central directory is never sent, so the client sees the error)
+                print(f"Archive entry failed for {item['url']}: {e}")
+                raise
+            finally:
+                if hasattr(chunks, 'close'):
+                    chunks.close()
+            yield buffer.drain()
+    yield buffer.drain()
+
+@app.route("/batch-download/<batch_id>")
+def batch_download(batch_id):
+    """Stream every ready item of a batch as one ZIP archive"""
+    batch = batch_data.get(batch_id, {})
+    if batch.get('status') not in ('running', 'finished'):
+        return jsonify({"error": "Batch not ready"}), 400
+
+    format_type = request.args.get("format", "video")
+    if format_type == 'audio':
+        quality = request.args.get("audio_quality", "high")
+    else:
+        quality = request.args.get("quality", "best")
+
+    # Items still extracting are waited for, so the download can start before the batch finishes
+    return Response(
+        MeteredStream(stream_batch_archive(batch.get('items', []), format_type, quality), 'archive',
+                      StageTimer('archive', batch_id)),
+        mimetype='application/zip',
+        headers={
+            'Content-Disposition': attachment_disposition(f"batch_{batch_id[:8]}.zip"),
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+# Async streaming engine settings - ASYNC_PROXY_PORT=0 keeps it disabled
+ASYNC_PROXY_PORT = int(os.environ.get('ASYNC_PROXY_PORT', 0))
+ASYNC_IDLE_TIMEOUT = int(os.environ.get('ASYNC_IDLE_TIMEOUT', 60))  # seconds without progress before dropping a stream
+ASYNC_STREAM_BUFFER = int(os.environ.get('ASYNC_STREAM_BUFFER', 256 * 1024))  # per-stream read buffer cap in bytes
+ASYNC_CHUNK_SIZE = 64 * 1024
+
+class AsyncStreamProxy:
+    """aiohttp server proxying the same download records as /stream-download.
+
+    Every transfer runs on one event loop thread, so thousands of slow clients cost a
+    single thread instead of a WSGI worker each. Put it behind the same host as the Flask
+    app (e.g. route /stream-download/ to this port). Under gunicorn, call start() from a
+    post_fork hook."""
+
+    def __init__(self, port, idle_timeout, buffer_size):
+        self.port = port
+        self.idle_timeout = idle_timeout
+        self.buffer_size = buffer_size
+        self.session = None
+        self.active_streams = 0
+        self.streams = 0
+        self.bytes_sent = 0
+        self.idle_timeouts = 0
+
+    def start(self):
+        threading.Thread(target=self._run, name="async-stream-proxy", daemon=True).start()
+
+    async def run_blocking(self, func, *args):
+        """Run store queries, disk I/O and yt-dlp calls off the event loop, so one slow call
+        doesn't stall every other transfer"""
+        return await asyncio.get_event_loop().run_in_executor(None, func, *args)
+
+    def _run(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(self._serve())
+        print(f"⚡ Async streaming engine listening on port {self.port}")
+        loop.run_forever()
+
+    async def _serve(self):
+        # sock_read bounds how long a stalled upstream may hold a stream, read_bufsize bounds
+        # how much of it is buffered in memory
+        self.session = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=self.idle_timeout),
+            connector=aiohttp.TCPConnector(limit=0),
+            read_bufsize=self.buffer_size,
+            auto_decompress=False
+        )
+        application = web.Application()
+        application.router.add_get('/stream-download/{download_id}', self.handle)
+        runner = web.AppRunner(application)
+        await runner.setup()
+        await web.TCPSite(runner, '0.0.0.0', self.port).start()
+
+    async def handle(self, request, retried=False):
+        download_id = request.match_info['download_id']
+        timer = request.setdefault('timer', StageTimer('stream', download_id, progress_data, 'stream_timings'))
+        progress_info = await self.run_blocking(progress_data.snapshot, download_id, {})
+
+        error = download_not_ready_error(progress_info)
+        if error:
+            return web.json_response({"error": error}, status=400)
+
+        if not retried and stream_urls_expiring(progress_info):
+            with timer.stage('refresh'):
+                progress_info = await self.run_blocking(refresh_download_urls, download_id, progress_info)
+
+        filename = progress_info.get('filename', 'video.mp4')
+        download_type = progress_info.get('download_type', 'video')
+        if download_type in ('audio-stream', 'audio-cached'):
+            cache_key = (progress_info.get('video_id'), 'mp3', progress_info.get('bitrate', '192'))
+            cached_file = await self.run_blocking(audio_cache.get, cache_key)
+            if cached_file:
+                # FileResponse only takes a path, which eviction may unlink - stream the open file instead
+                return web.Response(body=cached_file, headers={
+                    'Content-Type': 'audio/mpeg',
+                    'Content-Disposition': attachment_disposition(filename),
+                    'Cache-Control': 'no-cache',
+                    'Accept-Ranges': 'none',
+                    'Server-Timing': server_timing_header(timer.timings())
+                })
+            if not progress_info.get('url') and not retried:
+                # The cached transcode was evicted after the job finished
+                with timer.stage('refresh'):
+                    progress_info = await self.run_blocking(refresh_download_urls, download_id, progress_info)
+            response = await self.transcode_audio(request, progress_info, filename, cache_key)
+            return response or await self.retry(request, progress_info, retried)
+        if download_type == 'video-mux':
+            response = await self.mux_video(request, progress_info, filename)
+            return response or await self.retry(request, progress_info, retried)
+        if download_type != 'video':
+            return await self.serve_file(request, progress_info, filename)
+
+        direct_url = progress_info.get('url', '')
+        if not direct_url:
+            return web.json_response({"error": "No download URL available"}, status=404)
+
+        headers, client_range = upstream_request_headers(request.headers.get('Range'), request.headers.get('If-Range'))
+        try:
+            with timer.stage('upstream'):
+                upstream = await self.session.get(direct_url, headers=headers)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Async request error: {e}")
+            return web.json_response({"error": f"Error serving file: {str(e)}"}, status=500)
+
+        try:
+            if upstream.status == 403:
+                upstream.release()
+                return await self.retry(request, progress_info, retried)
+            if upstream.status == 416:
+                return web.Response(status=416, headers={'Content-Range': upstream.headers.get('Content-Range', 'bytes */*')})
+            if upstream.status >= 400:
+                return web.json_response({"error": f"Error serving file: upstream returned {upstream.status}"}, status=500)
+
+            status, response_headers = proxy_response_headers(filename, upstream.status, upstream.headers, client_range)
+            response_headers['Content-Type'] = 'video/mp4'
+            response_headers['Server-Timing'] = server_timing_header(timer.timings())
+            response = web.StreamResponse(status=status, headers=response_headers)
+            await response.prepare(request)
+
+            self.active_streams += 1
+            self.streams += 1
+            meter = StreamMeter('video', timer)
+            try:
+                async for chunk in upstream.content.iter_chunked(ASYNC_CHUNK_SIZE):
+                    # write() waits for the client to drain, so a stalled client times out here
+                    await asyncio.wait_for(response.write(chunk), self.idle_timeout)
+                    self.bytes_sent += len(chunk)
+                    meter.chunk(len(chunk))
+                await response.write_eof()
+            except asyncio.TimeoutError:
+                self.idle_timeouts += 1
+                print(f"Async stream idle for {self.idle_timeout}s, dropping: {filename}")
+            except (aiohttp.ClientError, ConnectionResetError) as e:
+                print(f"Async stream error: {e}")
+            finally:
+                self.active_streams -= 1
+                await self.run_blocking(meter.finish)
+            return response
+        finally:
+            upstream.release()
+
+    async def retry(self, request, progress_info, retried):
+        """The upstream rejected the signed URL - re-resolve it once and start over"""
+        if retried or not progress_info.get('youtube_url'):
+            return web.json_response({"error": "Error serving file: upstream returned 403"}, status=500)
+        with request['timer'].stage('refresh'):
+            await self.run_blocking(refresh_download_urls, request.match_info['download_id'], progress_info)
+        return await self.handle(request, retried=True)
+
+    async def transcode_audio(self, request, progress_info, filename, cache_key):
+        direct_url = progress_info.get('url', '')
+        if not direct_url:
+            return web.json_response({"error": "No download URL available"}, status=404)
+        cache_writer = await self.run_blocking(audio_cache.writer, cache_key)
+        return await self.stream_through_ffmpeg(request, [direct_url], mp3_output_args(cache_key[2]), transcode_slots,
+                                                'audio/mpeg', filename, cache_writer)
+
+    async def mux_video(self, request, progress_info, filename):
+        video_url = progress_info.get('url', '')
+        audio_url = progress_info.get('audio_url', '')
+        if not video_url or not audio_url:
+            return web.json_response({"error": "No download URL available"}, status=404)
+        return await self.stream_through_ffmpeg(request, [video_url, audio_url], MUX_OUTPUT_ARGS, mux_slots,
+                                                'video/mp4', filename)
+
+    async def acquire_slot(self, slots):
+        """Wait up to STREAM_SLOT_TIMEOUT for an ffmpeg slot without blocking the event loop.
+        Polling keeps cancellation safe - a slot is only ever taken by this coroutine"""
+        deadline = time.monotonic() + STREAM_SLOT_TIMEOUT
+        while not slots.acquire(blocking=False):
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(0.25)
+        return True
+
+    async def open_input_pipe(self, write_fd):
+        """Wrap the write end of an ffmpeg input pipe in a StreamWriter with backpressure"""
+        loop = asyncio.get_event_loop()
+        transport, protocol = await loop.connect_write_pipe(
+            lambda: asyncio.streams.FlowControlMixin(), open(write_fd, 'wb', buffering=0))
+        return asyncio.StreamWriter(transport, protocol, None, loop)
+
+    async def stream_through_ffmpeg(self, request, urls, output_args, slots, content_type, filename, cache_writer=None):
+        """Stream ffmpeg's output for the given inputs, or return None if an upstream rejected its signed URL"""
+        timer = request['timer']
+        with timer.stage('queue'):
+            acquired = await self.acquire_slot(slots)
+        if not acquired:
+            if cache_writer:
+                cache_writer.discard()
+            return web.json_response({"error": "Server busy, please try again shortly"}, status=503)
+
+        upstreams = []
+        writers = []
+        feeders = []
+        try:
+            headers, _ = upstream_request_headers(None, None)
+            try:
+                with timer.stage('upstream'):
+                    for url in urls:
+                        upstreams.append(await self.session.get(url, headers=headers))
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                print(f"Async request error: {e}")
+                return web.json_response({"error": f"Error serving file: {str(e)}"}, status=500)
+            for upstream in upstreams:
+                if upstream.status == 403:
+                    # Signed URL rejected - the caller re-resolves it
+                    return None
+                if upstream.status >= 400:
+                    return web.json_response({"error": f"Error serving file: upstream returned {upstream.status}"}, status=500)
+
+            pipes = [os.pipe() for _ in urls]
+            try:
+                with timer.stage('spawn'):
+                    ffmpeg = await asyncio.create_subprocess_exec(
+                        *ffmpeg_command([f'pipe:{read_fd}' for read_fd, _ in pipes], output_args),
+                        stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL,
+                        pass_fds=[read_fd for read_fd, _ in pipes])
+            except OSError:
+                for _, write_fd in pipes:
+                    os.close(write_fd)
+                raise
+            finally:
+                for read_fd, _ in pipes:
+                    os.close(read_fd)
+
+            writers = [await self.open_input_pipe(write_fd) for _, write_fd in pipes]
+
+            feed_errors = []
+
+            async def feed(upstream, writer):
+                try:
+                    async for chunk in upstream.content.iter_chunked(ASYNC_CHUNK_SIZE):
+                        writer.write(chunk)
+                        await writer.drain()
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    # The upstream failed partway - stop ffmpeg before the pipe closes, so the
+                    # output can't pass for a complete file
+                    feed_errors.append(e)
+                    if ffmpeg.returncode is None:
+                        ffmpeg.kill()
+                    print(f"ffmpeg feed stopped: {e}")
+                except (ConnectionResetError, BrokenPipeError) as e:
+                    print(f"ffmpeg feed stopped: {e}")
+                finally:
+                    writer.close()
+
+            feeders = [asyncio.ensure_future(feed(upstream, writer)) for upstream, writer in zip(upstreams, writers)]
+            response = web.StreamResponse(headers={
+                'Content-Type': content_type,
+                'Content-Disposition': attachment_disposition(filename),
+                'Cache-Control': 'no-cache',
+                'Accept-Ranges': 'none',
+                'Server-Timing': server_timing_header(timer.timings())
+            })
+            await response.prepare(request)
+
+            self.active_streams += 1
+            self.streams += 1
+            meter = StreamMeter('audio' if content_type.startswith('audio/') else 'video', timer)
+            try:
+                while True:
+                    chunk = await asyncio.wait_for(ffmpeg.stdout.read(ASYNC_CHUNK_SIZE), self.idle_timeout)
+                    if not chunk:
+                        break
+                    if cache_writer:
+                        cache_writer.write(chunk)
+                    await asyncio.wait_for(response.write(chunk), self.idle_timeout)
+                    self.bytes_sent += len(chunk)
+                    meter.chunk(len(chunk))
+                if await ffmpeg.wait() != 0 or feed_errors:
+                    # Raising after prepare() drops the connection, so the client sees a failed
+                    # download instead of a short file that looks complete
+                    raise Exception(f"ffmpeg output incomplete (exit code {ffmpeg.returncode}): {feed_errors}")
+                await response.write_eof()
+                if cache_writer:
+                    # commit() renames the entry into place and may evict older ones
+                    await self.run_blocking(cache_writer.commit)
+            except asyncio.TimeoutError:
+                self.idle_timeouts += 1
+                print(f"Async stream idle for {self.idle_timeout}s, dropping: {filename}")
+            except (aiohttp.ClientError, ConnectionResetError) as e:
+                print(f"Async stream error: {e}")
+            finally:
+                self.active_streams -= 1
+                await self.run_blocking(meter.finish)
+                if ffmpeg.returncode is None:
+                    ffmpeg.kill()
+                await ffmpeg.wait()
+            return response
+        finally:
+            for feeder in feeders:
+                feeder.cancel()
+            for writer in writers:
+                writer.close()
+            if cache_writer:
+                await self.run_blocking(cache_writer.discard)
+            for upstream in upstreams:
+                upstream.release()
+            slots.release()
+
+    async def serve_file(self, request, progress_info, filename):
+        filepath = progress_info.get('filepath', '')
+        if not filepath or not os.path.exists(filepath):
+            return web.json_response({"error": "Downloaded file not found"}, status=404)
+
+        # FileResponse uses sendfile and handles conditional and range requests
+        return CleanupFileResponse(filepath, headers={
+            'Content-Disposition': attachment_disposition(filename),
+            'Cache-Control': 'no-cache'
+        })
+
+    def stats(self):
+        return {
+            'port': self.port,
+            'active_streams': self.active_streams,
+            'streams': self.streams,
+            'bytes_sent': self.bytes_sent,
+            'idle_timeouts': self.idle_timeouts
+        }
+
+if AIOHTTP_AVAILABLE:
+    class CleanupFileResponse(web.FileResponse):
+        """FileResponse that follows the WSGI path's cleanup rule - full transfers delete the file"""
+
+        async def prepare(self, request):
+            # prepare() returns once the whole file is sent - a dropped transfer raises and keeps it
+            writer = await super().prepare(request)
+            if self.status == 200 and request.method != 'HEAD':
+                await asyncio.get_event_loop().run_in_executor(None, remove_served_file, self._path)
+            return writer
+
+async_proxy = None
+if ASYNC_PROXY_PORT:
+    if AIOHTTP_AVAILABLE:
+        async_proxy = AsyncStreamProxy(ASYNC_PROXY_PORT, ASYNC_IDLE_TIMEOUT, ASYNC_STREAM_BUFFER)
+    else:
+        print("INFO: aiohttp not found. Async streaming engine disabled.")
+
 if __name__ == "__main__":
+    # With the debug reloader, only the serving child process starts the engine
+    if async_proxy and os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        async_proxy.start()
     app.run(debug=True, host="0.0.0.0", port=5300)
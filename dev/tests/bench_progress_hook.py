@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Benchmark the yt-dlp progress hook - string-parsing hook that rewrites the record on every
+callback vs the throttled ProgressReporter
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+import app
+
+CALLBACKS = 200000
+TOTAL_BYTES = 50 * 1024 * 1024
+
+def make_events():
+    """Synthetic 'downloading' callbacks, as yt-dlp sends them for every block written"""
+    events = []
+    for i in range(CALLBACKS):
+        downloaded = TOTAL_BYTES * i // CALLBACKS
+        percent = downloaded * 100 / TOTAL_BYTES
+        events.append({
+            'status': 'downloading',
+            'filename': 'downloads/job/Song.m4a',
+            'downloaded_bytes': downloaded,
+            'total_bytes': TOTAL_BYTES,
+            'speed': 2.5 * 1024 * 1024,
+            'eta': 20,
+            '_percent_str': f"{percent:5.1f}%",
+            '_eta_str': '00:20',
+            '_speed_str': '2.50MiB/s'
+        })
+    return events
+
+def legacy_hook(download_id, filename):
+    """The previous hook - parses yt-dlp's strings and replaces the record on every callback"""
+    def progress_hook(d):
+        if d['status'] == 'downloading':
+            percent_str = d.get('_percent_str', '0.0%')
+            try:
+                percent_num = float(percent_str.replace('%', '').strip()) if percent_str else 0
+                app.progress_data[download_id] = {
+                    'progress': f"{percent_num}%",
+                    'progress_text': percent_str,
+                    'eta': d.get('_eta_str', '...'),
+                    'speed': d.get('_speed_str', '...'),
+                    'filename': os.path.basename(d.get('filename', filename)),
+                    'status': 'downloading'
+                }
+            except:
+                pass
+    return progress_hook
+
+def run(hook, events, download_id):
+    version = app.progress_data.wait_for_change(download_id, -1, 0)
+    start_time = time.perf_counter()
+    for event in events:
+        hook(event)
+    elapsed = time.perf_counter() - start_time
+    updates = app.progress_data.wait_for_change(download_id, -1, 0) - version
+    return elapsed, updates
+
+def bench_progress_hook():
+    events = make_events()
+    print(f"🧪 Benchmarking {CALLBACKS} progress callbacks...")
+
+    app.progress_data['legacy'] = {'status': 'starting'}
+    legacy_time, legacy_updates = run(legacy_hook('legacy', 'Song.mp3'), events, 'legacy')
+    print(f"📈 Legacy hook: {legacy_time * 1e6 / CALLBACKS:.2f} µs/callback, {legacy_updates} record updates")
+
+    app.progress_data['reporter'] = {'status': 'starting'}
+    reporter = app.ProgressReporter('reporter', 'Song.mp3')
+    reporter_time, reporter_updates = run(reporter, events, 'reporter')
+    print(f"📈 ProgressReporter: {reporter_time * 1e6 / CALLBACKS:.2f} µs/callback, {reporter_updates} record updates")
+
+    # Without the time throttle, only changes in the displayed percentage get through
+    app.progress_data['unthrottled'] = {'status': 'starting'}
+    unthrottled = app.ProgressReporter('unthrottled', 'Song.mp3', interval=0)
+    unthrottled_time, unthrottled_updates = run(unthrottled, events, 'unthrottled')
+    print(f"📈 ProgressReporter (no interval): {unthrottled_time * 1e6 / CALLBACKS:.2f} µs/callback, "
+          f"{unthrottled_updates} record updates")
+
+    if reporter_time >= legacy_time:
+        print("❌ ProgressReporter was not faster than the legacy hook")
+        return False
+
+    print(f"✅ {legacy_time / reporter_time:.1f}x faster, {legacy_updates - reporter_updates} fewer subscriber wake-ups")
+    return True
+
+if __name__ == "__main__":
+    success = bench_progress_hook()
+
+    if success:
+        print("\n🎉 Benchmark PASSED! Progress updates are coalesced.")
+    else:
+        print("\n❌ Benchmark FAILED! Check the output above for details.")
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Test segmented upstream fetching against a local server that throttles each connection
+"""
+import os
+import sys
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+import app
+
+DATA = os.urandom(256 * 1024)
+CHUNK_DELAY = 0.01  # seconds per 8 KB chunk, per connection
+
+class ThrottledHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        start, end = 0, len(DATA) - 1
+        range_header = self.headers.get('Range', '')
+        if range_header.startswith('bytes='):
+            first, last = range_header[6:].split('-')
+            start = int(first)
+            end = min(int(last), end) if last else end
+
+        body = DATA[start:end + 1]
+        self.send_response(206 if range_header else 200)
+        if range_header:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(DATA)}')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+
+        for i in range(0, len(body), 8192):
+            self.wfile.write(body[i:i + 8192])
+            time.sleep(CHUNK_DELAY)
+
+def test_segmented_fetch():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ThrottledHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/video"
+    headers, _ = app.upstream_request_headers(None, None)
+
+    segment_size, segment_count = app.SEGMENT_SIZE, app.SEGMENT_COUNT
+    app.SEGMENT_SIZE = 32 * 1024
+    app.SEGMENT_COUNT = 4
+
+    print("🧪 Testing segmented fetching...")
+
+    try:
+        # Single throttled connection
+        start_time = time.time()
+        single = app.upstream_session.get(url, headers=headers, timeout=30).content
+        single_time = time.time() - start_time
+        print(f"📈 Single connection: {len(single)} bytes in {single_time:.2f}s")
+
+        # Parallel segments
+        start_time = time.time()
+        segmented = b''.join(app.SegmentedFetch(url, headers, 0, len(DATA) - 1))
+        segmented_time = time.time() - start_time
+        print(f"📈 {app.SEGMENT_COUNT} segments in parallel: {len(segmented)} bytes in {segmented_time:.2f}s")
+
+        assert single == DATA and segmented == DATA, "Reassembled data does not match the source"
+        assert segmented_time < single_time, "Segmented fetching was not faster than a single connection"
+
+        stats = app.segment_stats.stats()
+        print(f"✅ Segments fetched: {stats['segments']}, avg throughput: {stats['avg_throughput']} B/s")
+    finally:
+        server.shutdown()
+        app.SEGMENT_SIZE, app.SEGMENT_COUNT = segment_size, segment_count
+
+if __name__ == "__main__":
+    try:
+        test_segmented_fetch()
+        print("\n🎉 Test PASSED! Segmented fetching is working correctly.")
+    except AssertionError as e:
+        print(f"\n❌ Test FAILED! {e}")